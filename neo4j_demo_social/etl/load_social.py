@@ -1,146 +1,258 @@
-import csv, os
-from neo4j import GraphDatabase
+import asyncio, csv, os, shutil, subprocess, threading
+from itertools import islice
+from neo4j import AsyncGraphDatabase
 
 URI  = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
 USER = os.getenv("NEO4J_USER", "neo4j")
 PASS = os.getenv("NEO4J_PASS", "password")
 
 PEOPLE = "/import/social-graph/people.csv"
-KNOWS  = "/import/social-graph/knows.csv"
 COMPANIES = "/import/social-graph/companies.csv"
+KNOWS = "/import/social-graph/knows.csv"
 WORKS_AT = "/import/social-graph/works_at.csv"
 
-def run(tx, query, **params):
-    tx.run(query, **params)
+# Offline cold-start path: neo4j-admin bulk import (needs the server stopped)
+ADMIN_IMPORT = os.getenv("SOCIAL_ADMIN_IMPORT", "0") == "1"
+ADMIN_DIR = "/import/social-graph/admin"
+DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# Relationship CSVs are read server-side by LOAD CSV (relative to the Neo4j import dir)
+KNOWS_URL = "file:///social-graph/knows.csv"
+WORKS_AT_URL = "file:///social-graph/works_at.csv"
+
+BATCH_SIZE = 10000
+TX_BATCHES = 10  # UNWIND batches per explicit transaction (~100k rows per commit / tx-log flush)
+MAX_IN_FLIGHT = 64  # concurrent write transactions (each uses its own pooled connection)
+QUEUE_SIZE = 4  # parsed transaction groups buffered ahead of the writers
+
+# Driver tuning: the pool must comfortably exceed MAX_IN_FLIGHT so writers never starve
+POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "128"))
+FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "10000"))
+
+CONSTRAINTS = [
+    "CREATE CONSTRAINT person_name IF NOT EXISTS FOR (p:Person) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT company_name IF NOT EXISTS FOR (c:Company) REQUIRE c.name IS UNIQUE",
+]
+
+PEOPLE_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Person {name: row.name})
+SET p.age = toInteger(row.age), p.city = row.city
+"""
+
+COMPANIES_QUERY = """
+UNWIND $rows AS row
+MERGE (c:Company {name: row.name})
+SET c.city = row.city, c.industry = row.industry, c.founded = toInteger(row.founded)
+"""
+
+KNOWS_ITERATE = (
+    """
+    LOAD CSV WITH HEADERS FROM $url AS row
+    WITH row WHERE trim(coalesce(row.src, '')) <> '' AND trim(coalesce(row.dst, '')) <> ''
+    RETURN row
+    """,
+    """
+    MATCH (a:Person {name: trim(row.src)}), (b:Person {name: trim(row.dst)})
+    MERGE (a)-[r:KNOWS]->(b)
+    SET r.since = toInteger(row.since)
+    """,
+)
+
+WORKS_AT_ITERATE = (
+    """
+    LOAD CSV WITH HEADERS FROM $url AS row
+    WITH row WHERE trim(coalesce(row.person, '')) <> '' AND trim(coalesce(row.company, '')) <> ''
+    RETURN row
+    """,
+    """
+    MATCH (p:Person {name: trim(row.person)}), (c:Company {name: trim(row.company)})
+    MERGE (p)-[w:WORKS_AT]->(c)
+    SET w.position = CASE trim(coalesce(row.position, '')) WHEN '' THEN null ELSE trim(row.position) END,
+        w.since = toInteger(row.since),
+        w.salary = toInteger(row.salary)
+    """,
+)
+
+# Server-side parallel batches; retries absorb lock conflicts between batches sharing a node
+ITERATE_QUERY = """
+CALL apoc.periodic.iterate($outer, $inner,
+    {batchSize: 1000, parallel: true, retries: 3, params: {url: $url}})
+YIELD total, failedOperations, errorMessages
+RETURN total, failedOperations, errorMessages
+"""
+
+async def run(tx, query, **params):
+    result = await tx.run(query, **params)
+    await result.consume()
+
+def read_rows(path, required, optional=()):
+    """
+    Yield one dict per CSV row holding only its non-empty fields (raw strings).
+    Rows missing a required field are skipped; type coercion happens in Cypher.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        r = csv.reader(f)
+        idx = {h: i for i, h in enumerate(next(r))}
+        fields = [(k, idx[k], True) for k in required] + [(k, idx[k], False) for k in optional if k in idx]
+        for rec in r:
+            row = {}
+            for key, i, req in fields:
+                value = rec[i].strip() if i < len(rec) else ""
+                if value:
+                    row[key] = value
+                elif req:
+                    break
+            else:
+                yield row
+
+def chunks(rows, size=BATCH_SIZE):
+    """Group an iterator of rows into lists of at most `size` rows"""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+async def write_chunks(tx, query, group):
+    for chunk in group:
+        await run(tx, query, rows=chunk)
+
+async def write_group(driver, query, group):
+    # One managed transaction (one commit) for several UNWIND batches;
+    # execute_write retries the whole group on transient errors (e.g. deadlocks)
+    async with driver.session() as s:
+        await s.execute_write(write_chunks, query, group)
+
+async def load(driver, query, rows):
+    # CSV decode runs in a thread feeding a bounded queue, so parsing overlaps with the writes;
+    # TX_BATCHES chunks per transaction, up to MAX_IN_FLIGHT transactions overlapping on the wire
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item):
+        # Re-check `stop` every second, so a full queue cannot block the thread once the writers are gone
+        while not stop.is_set():
+            try:
+                return asyncio.run_coroutine_threadsafe(asyncio.wait_for(queue.put(item), 1), loop).result()
+            except asyncio.TimeoutError:
+                pass
+
+    def produce():
+        for group in chunks(chunks(rows), TX_BATCHES):
+            if stop.is_set():
+                return
+            put(group)
+        put(None)
+
+    async def consume():
+        while (group := await queue.get()) is not None:
+            await write_group(driver, query, group)
+        await queue.put(None)  # end-of-file sentinel, passed on to the other writers
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    writers = [asyncio.create_task(consume()) for _ in range(MAX_IN_FLIGHT)]
+    try:
+        await asyncio.gather(producer, *writers)
+    except BaseException:
+        # First error: stop the reader thread and cancel the other writers, then let it reach main()
+        stop.set()
+        for writer in writers:
+            writer.cancel()
+        await asyncio.gather(producer, *writers, return_exceptions=True)
+        raise
+
+async def load_server_side(session, statements, url):
+    outer, inner = statements
+    result = await session.run(ITERATE_QUERY, outer=outer, inner=inner, url=url)
+    record = await result.single()
+    if record["failedOperations"]:
+        print(f"Warning: {record['failedOperations']} rows from {url} failed: {record['errorMessages']}")
+
+def write_admin_csv(path, header, rows, fields):
+    """Rewrite loader rows into neo4j-admin import format (typed header, empty = null)"""
+    with open(path, "w", newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        for row in rows:
+            w.writerow([row.get(k, "") for k in fields])
+
+def admin_import():
+    """
+    Full offline import with neo4j-admin (replaces the database, like the demo reset).
+    Run where neo4j-admin is installed with the server stopped; the name
+    constraints (CONSTRAINTS) must be created once the server is back up.
+    """
+    os.makedirs(ADMIN_DIR, exist_ok=True)
+    people = os.path.join(ADMIN_DIR, "people.csv")
+    companies = os.path.join(ADMIN_DIR, "companies.csv")
+    knows = os.path.join(ADMIN_DIR, "knows.csv")
+    works_at = os.path.join(ADMIN_DIR, "works_at.csv")
+
+    write_admin_csv(people, ["name:ID(Person)", "age:int", "city"],
+                    read_rows(PEOPLE, ["name"], ["age", "city"]), ["name", "age", "city"])
+    write_admin_csv(companies, ["name:ID(Company)", "city", "industry", "founded:int"],
+                    read_rows(COMPANIES, ["name"], ["city", "industry", "founded"]),
+                    ["name", "city", "industry", "founded"])
+    write_admin_csv(knows, [":START_ID(Person)", ":END_ID(Person)", "since:int"],
+                    read_rows(KNOWS, ["src", "dst"], ["since"]), ["src", "dst", "since"])
+    write_admin_csv(works_at, [":START_ID(Person)", ":END_ID(Company)", "position", "since:int", "salary:int"],
+                    read_rows(WORKS_AT, ["person", "company"], ["position", "since", "salary"]),
+                    ["person", "company", "position", "since", "salary"])
+
+    # Duplicate names collapse (MERGE semantics), dangling relationships are skipped (MATCH semantics)
+    subprocess.run([
+        "neo4j-admin", "database", "import", "full",
+        f"--nodes=Person={people}",
+        f"--nodes=Company={companies}",
+        f"--relationships=KNOWS={knows}",
+        f"--relationships=WORKS_AT={works_at}",
+        "--skip-duplicate-nodes=true",
+        "--skip-bad-relationships=true",
+        "--overwrite-destination=true",
+        DATABASE,
+    ], check=True)
+    print(f"Imported {DATABASE} with neo4j-admin; start the server and create the name constraints")
+
+async def count(session, query):
+    result = await session.run(query)
+    return (await result.single())["c"]
+
+async def main():
+    driver = AsyncGraphDatabase.driver(URI, auth=(USER, PASS),
+                                       max_connection_pool_size=POOL_SIZE,
+                                       connection_acquisition_timeout=120,
+                                       fetch_size=FETCH_SIZE,
+                                       keep_alive=True)
+    async with driver.session() as s:
+        # Schema first: MERGE/MATCH on name become index seeks instead of label scans
+        for constraint in CONSTRAINTS:
+            await (await s.run(constraint)).consume()
 
-def main():
-    driver = GraphDatabase.driver(URI, auth=(USER, PASS))
-    with driver.session() as s:
         # Reset (Demo!)
-        s.execute_write(run, "MATCH (n) DETACH DELETE n")
-
-        # Nodes
-        with open(PEOPLE, newline='', encoding='utf-8') as f:
-            r = csv.DictReader(f)
-            for row in r:
-                name = (row.get("name") or "").strip()
-                if not name: 
-                    continue
-                
-                # Parse age and city
-                age = None
-                if row.get("age"):
-                    try:
-                        age = int(row["age"])
-                    except ValueError:
-                        pass
-                
-                city = (row.get("city") or "").strip() or None
-                
-                s.execute_write(
-                    run,
-                    """
-                    MERGE (p:Person {name: $name})
-                    SET p.age = $age, p.city = $city
-                    """,
-                    name=name, age=age, city=city
-                )
-
-        # Companies
-        with open(COMPANIES, newline='', encoding='utf-8') as f:
-            r = csv.DictReader(f)
-            for row in r:
-                name = (row.get("name") or "").strip()
-                if not name:
-                    continue
-                
-                city = (row.get("city") or "").strip() or None
-                industry = (row.get("industry") or "").strip() or None
-                founded = None
-                if row.get("founded"):
-                    try:
-                        founded = int(row["founded"])
-                    except ValueError:
-                        pass
-                
-                s.execute_write(
-                    run,
-                    """
-                    MERGE (c:Company {name: $name})
-                    SET c.city = $city, c.industry = $industry, c.founded = $founded
-                    """,
-                    name=name, city=city, industry=industry, founded=founded
-                )
-
-        # KNOWS Relationships
-        with open(KNOWS, newline='', encoding='utf-8') as f:
-            r = csv.DictReader(f)
-            for row in r:
-                src = (row.get("src") or "").strip()
-                dst = (row.get("dst") or "").strip()
-                if not src or not dst:
-                    continue
-                # Parse since attribute
-                since = None
-                if row.get("since"):
-                    try:
-                        since = int(row["since"])
-                    except ValueError:
-                        pass
-                
-                s.execute_write(
-                    run,
-                    """
-                    MATCH (a:Person {name: $src}), (b:Person {name: $dst})
-                    MERGE (a)-[r:KNOWS]->(b)
-                    SET r.since = $since
-                    """,
-                    src=src, dst=dst, since=since
-                )
-
-        # WORKS_AT Relationships
-        with open(WORKS_AT, newline='', encoding='utf-8') as f:
-            r = csv.DictReader(f)
-            for row in r:
-                person = (row.get("person") or "").strip()
-                company = (row.get("company") or "").strip()
-                if not person or not company:
-                    continue
-                
-                position = (row.get("position") or "").strip() or None
-                since = None
-                salary = None
-                
-                if row.get("since"):
-                    try:
-                        since = int(row["since"])
-                    except ValueError:
-                        pass
-                
-                if row.get("salary"):
-                    try:
-                        salary = int(row["salary"])
-                    except ValueError:
-                        pass
-                
-                s.execute_write(
-                    run,
-                    """
-                    MATCH (p:Person {name: $person}), (c:Company {name: $company})
-                    MERGE (p)-[w:WORKS_AT]->(c)
-                    SET w.position = $position, w.since = $since, w.salary = $salary
-                    """,
-                    person=person, company=company, position=position, since=since, salary=salary
-                )
+        await s.execute_write(run, "MATCH (n) DETACH DELETE n")
+
+    # Nodes
+    await load(driver, PEOPLE_QUERY, read_rows(PEOPLE, ["name"], ["age", "city"]))
+    await load(driver, COMPANIES_QUERY, read_rows(COMPANIES, ["name"], ["city", "industry", "founded"]))
+
+    async with driver.session() as s:
+        # Relationships (no Python hop: Neo4j reads the CSVs itself)
+        await load_server_side(s, KNOWS_ITERATE, KNOWS_URL)
+        await load_server_side(s, WORKS_AT_ITERATE, WORKS_AT_URL)
 
         # Quick sanity
-        persons = s.run("MATCH (n:Person) RETURN count(n) AS c").single()["c"]
-        companies = s.run("MATCH (n:Company) RETURN count(n) AS c").single()["c"]
-        knows_rels = s.run("MATCH ()-[r:KNOWS]->() RETURN count(r) AS c").single()["c"]
-        works_rels = s.run("MATCH ()-[r:WORKS_AT]->() RETURN count(r) AS c").single()["c"]
+        persons = await count(s, "MATCH (n:Person) RETURN count(n) AS c")
+        companies = await count(s, "MATCH (n:Company) RETURN count(n) AS c")
+        knows_rels = await count(s, "MATCH ()-[r:KNOWS]->() RETURN count(r) AS c")
+        works_rels = await count(s, "MATCH ()-[r:WORKS_AT]->() RETURN count(r) AS c")
         print(f"Loaded persons={persons}, companies={companies}, knows={knows_rels}, works_at={works_rels}")
 
-    driver.close()
+    await driver.close()
 
 if __name__ == "__main__":
-    main()
+    if ADMIN_IMPORT and shutil.which("neo4j-admin"):
+        admin_import()
+    else:
+        if ADMIN_IMPORT:
+            print("neo4j-admin not found, falling back to the Bolt load")
+        asyncio.run(main())
@@ -15,37 +15,89 @@ Run with different confidence thresholds to optimize mapping rate.
 from neo4j import GraphDatabase
 from modules.drugbank_csv_loader import DrugBankCSVLoader
 from modules.medication_mapper import MedicationMapper
+from collections import Counter
+import io
 import os
 import sys
 
 
-def analyze_mapping_quality(csv_loader: DrugBankCSVLoader, medications: list):
+MAPPING_BATCH_SIZE = 5000
+
+# Driver tuning for bulk reads/writes (overridable via environment)
+POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "128"))
+FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "10000"))
+
+
+def _create_mappings(tx, rows: list):
+    tx.run("""
+        UNWIND $rows AS row
+        MATCH (m:Medication {code: row.code})
+        MATCH (d:DrugBankDrug {drugbank_id: row.dbid})
+        MERGE (m)-[r:MAPPED_TO]->(d)
+        SET r.confidence = row.conf,
+            r.method = row.method,
+            r.extracted_name = row.ext,
+            r.created = datetime()
+    """, rows=rows).consume()
+
+
+def match_medications(csv_loader: DrugBankCSVLoader, medications: list,
+                      threshold: float, use_advanced: bool = True) -> list:
+    """
+    Match all medications against DrugBank
+    
+    Many Synthea descriptions are dose variants of the same drug, so names are
+    extracted once per unique description (vectorized) and searched once per
+    unique extracted name.
+    Both strategies score all names at once as RapidFuzz matrices
+    (process.cdist, native and multi-threaded) against the precomputed
+    DrugBank name index.
+    
+    Returns:
+        List of (medication, extracted_name, match) in input order, where match
+        is (drugbank_id, confidence, method) or None
+    """
+    descriptions = list(dict.fromkeys(med['description'] for med in medications))
+    extract = dict(zip(descriptions, csv_loader.extract_drug_names_from_synthea(descriptions)))
+    extracted = [extract[med['description']] for med in medications]
+    unique_names = list(dict.fromkeys(extracted))
+    
+    if use_advanced:
+        matches = dict(zip(unique_names,
+                           csv_loader.search_by_name_advanced_batch(unique_names, threshold=threshold)))
+    else:
+        best = csv_loader.search_by_name_batch(unique_names, threshold=threshold)
+        matches = {name: (*match, 'standard_fuzzy') if match else None
+                   for name, match in zip(unique_names, best)}
+    
+    return [(med, name, matches[name]) for med, name in zip(medications, extracted)]
+
+
+def analyze_mapping_quality(csv_loader: DrugBankCSVLoader, medications: list,
+                            threshold: float = 0.75) -> list:
     """
     Analyze mapping quality with different strategies
+    
+    Returns:
+        The advanced match results (see match_medications()) so callers can
+        create mappings without matching again
     """
     print("\n" + "="*80)
     print("🔬 Mapping Strategy Analysis")
     print("="*80)
     
-    strategies_count = {
-        'exact_match': 0,
-        'synonym_exact': 0,
-        'stemming': 0,
-        'levenshtein': 0,
-        'fuzzy_match': 0,
-        'fuzzy_synonym': 0,
-        'unmapped': 0
-    }
-    
     print("\nAnalyzing each medication with advanced search...\n")
     
-    for med in medications[:20]:  # Analyze first 20 for display
-        extracted = csv_loader.extract_drug_name_from_synthea(med['description'])
-        matches = csv_loader.search_by_name_advanced(extracted, threshold=0.75)
-        
-        if matches:
-            best_id, confidence, method = matches[0]
-            strategies_count[method] += 1
+    results = match_medications(csv_loader, medications, threshold=threshold)
+    
+    # One pass over all results (not just the displayed ones)
+    strategies_count = Counter(match[2] if match else 'unmapped' for _, _, match in results)
+    
+    out = io.StringIO()
+    
+    for med, extracted, match in results[:20]:  # Show first 20
+        if match:
+            best_id, confidence, method = match
             
             drug_info = csv_loader.get_drug_by_id(best_id)
             
@@ -60,34 +112,29 @@ def analyze_mapping_quality(csv_loader: DrugBankCSVLoader, medications: list):
             }
             icon = icons.get(method, '❓')
             
-            print(f"   {icon} {med['description'][:40]:<40} → {drug_info['Common name'][:20]:<20} ({confidence:.2f}, {method})")
+            out.write(f"   {icon} {med['description'][:40]:<40} → {drug_info['Common name'][:20]:<20} ({confidence:.2f}, {method})\n")
         else:
-            strategies_count['unmapped'] += 1
-            print(f"   ❌ {med['description'][:40]:<40} → UNMAPPED (extracted: {extracted})")
+            out.write(f"   ❌ {med['description'][:40]:<40} → UNMAPPED (extracted: {extracted})\n")
     
     if len(medications) > 20:
-        print(f"\n   ... analyzing remaining {len(medications) - 20} medications ...")
-        
-        for med in medications[20:]:
-            extracted = csv_loader.extract_drug_name_from_synthea(med['description'])
-            matches = csv_loader.search_by_name_advanced(extracted, threshold=0.75)
-            
-            if matches:
-                _, _, method = matches[0]
-                strategies_count[method] += 1
-            else:
-                strategies_count['unmapped'] += 1
+        out.write(f"\n   ... analyzing remaining {len(medications) - 20} medications ...\n")
     
-    print("\n" + "="*80)
-    print("📊 Strategy Distribution")
-    print("="*80)
-    for strategy, count in sorted(strategies_count.items(), key=lambda x: x[1], reverse=True):
+    out.write("\n" + "="*80 + "\n")
+    out.write("📊 Strategy Distribution\n")
+    out.write("="*80 + "\n")
+    for strategy, count in strategies_count.most_common():
         if count > 0:
             percentage = count / len(medications) * 100
-            print(f"   {strategy:<20}: {count:>3} ({percentage:>5.1f}%)")
+            out.write(f"   {strategy:<20}: {count:>3} ({percentage:>5.1f}%)\n")
     
     total_mapped = len(medications) - strategies_count['unmapped']
-    print(f"\n   Total Mapped: {total_mapped}/{len(medications)} ({total_mapped/len(medications)*100:.1f}%)")
+    out.write(f"\n   Total Mapped: {total_mapped}/{len(medications)} ({total_mapped/len(medications)*100:.1f}%)\n")
+    
+    # Emit the whole report with one write instead of one print per line
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
+    
+    return results
 
 
 def advanced_remap_medications(confidence_threshold: float = 0.75, 
@@ -122,7 +169,11 @@ def advanced_remap_medications(confidence_threshold: float = 0.75,
     print(f"\n🔌 Connecting to Neo4j: {neo4j_uri}")
     
     try:
-        driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_pass))
+        driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_pass),
+                                      max_connection_pool_size=POOL_SIZE,
+                                      connection_acquisition_timeout=120,
+                                      fetch_size=FETCH_SIZE,
+                                      keep_alive=True)
         
         with driver.session() as session:
             # Load CSV
@@ -142,9 +193,10 @@ def advanced_remap_medications(confidence_threshold: float = 0.75,
             
             print(f"   Found {len(medications)} medications to analyze")
             
-            # Analyze mapping strategies
+            # Analyze mapping strategies (results are reused for the mappings below)
+            results = None
             if use_advanced:
-                analyze_mapping_quality(csv_loader, medications)
+                results = analyze_mapping_quality(csv_loader, medications, confidence_threshold)
             
             if analyze_only:
                 print("\n✅ Analysis complete (no mappings created)")
@@ -168,50 +220,30 @@ def advanced_remap_medications(confidence_threshold: float = 0.75,
             # Strategy counters
             strategy_stats = {}
             
-            for med in medications:
-                extracted = csv_loader.extract_drug_name_from_synthea(med['description'])
-                
-                # Use advanced or standard search
-                if use_advanced:
-                    matches = csv_loader.search_by_name_advanced(extracted, threshold=confidence_threshold)
-                    if matches:
-                        drugbank_id, confidence, method = matches[0]
-                        strategy_stats[method] = strategy_stats.get(method, 0) + 1
-                    else:
-                        matches = []
-                else:
-                    matches = csv_loader.search_by_name(extracted, threshold=confidence_threshold)
-                    if matches:
-                        drugbank_id, confidence = matches[0]
-                        method = 'standard_fuzzy'
-                        strategy_stats[method] = strategy_stats.get(method, 0) + 1
-                
-                if matches:
-                    if use_advanced:
-                        drugbank_id, confidence, method = matches[0]
-                    else:
-                        drugbank_id, confidence = matches[0]
-                        method = 'standard_fuzzy'
-                    
-                    # Create mapping
-                    session.run("""
-                        MATCH (m:Medication {code: $med_code})
-                        MATCH (d:DrugBankDrug {drugbank_id: $drugbank_id})
-                        MERGE (m)-[r:MAPPED_TO]->(d)
-                        SET r.confidence = $confidence,
-                            r.method = $method,
-                            r.extracted_name = $extracted_name,
-                            r.created = datetime()
-                    """, med_code=med["code"],
-                         drugbank_id=drugbank_id,
-                         confidence=confidence,
-                         method=method,
-                         extracted_name=extracted)
-                    
+            # Match (advanced or standard search) unless the analysis already did
+            if results is None:
+                results = match_medications(csv_loader, medications, confidence_threshold, use_advanced)
+            
+            mappings = []
+            for med, extracted, match in results:
+                if match:
+                    drugbank_id, confidence, method = match
+                    strategy_stats[method] = strategy_stats.get(method, 0) + 1
+                    mappings.append({
+                        "code": med["code"],
+                        "dbid": drugbank_id,
+                        "conf": confidence,
+                        "method": method,
+                        "ext": extracted
+                    })
                     mapped_count += 1
                 else:
                     unmapped.append((med['description'], extracted))
             
+            # Create mappings (one UNWIND transaction per batch)
+            for i in range(0, len(mappings), MAPPING_BATCH_SIZE):
+                session.execute_write(_create_mappings, mappings[i:i + MAPPING_BATCH_SIZE])
+            
             # Summary
             print("\n" + "="*80)
             print("📊 Mapping Results")
@@ -7,13 +7,45 @@ from neo4j import GraphDatabase
 from modules.drugbank_csv_loader import DrugBankCSVLoader
 from modules.drugbank_interaction_parser import DrugBankInteractionParser
 from modules.medication_mapper import MedicationMapper
+from modules.base import prefetch, IMPORT_DIR
+import csv
 import os
+import re
 import sys
 
 # Pfade (im Docker Container)
 DRUGBANK_CSV = "/data/drugbank/drugbank vocabulary.csv"
 DRUGBANK_XML = "/data/drugbank/full database.xml"
 
+# Optional: write interactions to the shared import dir and let Neo4j read them with LOAD CSV
+USE_LOAD_CSV = os.getenv("DRUGBANK_LOAD_CSV", "false").lower() == "true"
+INTERACTIONS_CSV = os.path.join(IMPORT_DIR, "drugbank_interactions.csv")
+INTERACTIONS_CSV_URL = "file:///drugbank_interactions.csv"
+
+# Drugs per write transaction: ~15k drugs commit in two transactions, well under tx memory limits
+DRUG_BATCH_SIZE = 10000
+
+# Severity keywords, compiled once into one case-insensitive alternation per class
+HIGH_SEVERITY_KEYWORDS = ['contraindicated', 'avoid', 'life-threatening', 'severe', 'dangerous', 'fatal', 'death']
+MODERATE_SEVERITY_KEYWORDS = ['increase', 'decrease', 'risk', 'toxicity', 'monitor', 'caution', 'may cause']
+
+HIGH_SEVERITY_RE = re.compile('|'.join(map(re.escape, HIGH_SEVERITY_KEYWORDS)), re.IGNORECASE)
+MODERATE_SEVERITY_RE = re.compile('|'.join(map(re.escape, MODERATE_SEVERITY_KEYWORDS)), re.IGNORECASE)
+
+# Same alternations as Cypher =~ patterns (full-string match, case-insensitive, dotall)
+HIGH_SEVERITY_PATTERN = '(?is).*(?:' + HIGH_SEVERITY_RE.pattern + ').*'
+MODERATE_SEVERITY_PATTERN = '(?is).*(?:' + MODERATE_SEVERITY_RE.pattern + ').*'
+
+# Broader keyword sets used by the single-interaction loader
+HIGH_SEVERITY_EXTENDED_RE = re.compile('|'.join(map(re.escape, [
+    'contraindicated', 'avoid', 'life-threatening', 'severe', 'dangerous', 'fatal', 'death',
+    'emergency', 'should not', 'do not', 'never', 'serious', 'critical'
+])), re.IGNORECASE)
+MODERATE_SEVERITY_EXTENDED_RE = re.compile('|'.join(map(re.escape, [
+    'increase', 'decrease', 'risk', 'toxicity', 'may cause', 'monitor', 'caution', 'adverse',
+    'affect', 'may', 'potential', 'recommended', 'consider', 'adjustment', 'dose'
+])), re.IGNORECASE)
+
 
 def drugbank_available() -> tuple[bool, bool]:
     """
@@ -37,28 +69,44 @@ def create_drugbank_constraints(tx):
     tx.run("""
         CREATE CONSTRAINT drugbank_id IF NOT EXISTS
         FOR (d:DrugBankDrug) REQUIRE d.drugbank_id IS UNIQUE
-    """)
+    """).consume()
     
     print("   ✅ Created constraint on DrugBankDrug.drugbank_id")
 
 
-def load_drugbank_drugs(tx, drug_data: dict):
+def load_drugbank_drugs_batch(tx, rows: list):
     """
-    Load DrugBankDrug nodes into Neo4j
+    Load a batch of DrugBankDrug nodes into Neo4j (one UNWIND per transaction)
     
     Args:
         tx: Neo4j transaction
-        drug_data: Dict with drug properties
+        rows: List of dicts with drug properties
     """
     query = """
-    MERGE (d:DrugBankDrug {drugbank_id: $drugbank_id})
-    SET d.common_name = $common_name,
-        d.cas_number = $cas_number,
-        d.unii = $unii,
-        d.synonyms = $synonyms,
-        d.inchi_key = $inchi_key
+    UNWIND $rows AS row
+    MERGE (d:DrugBankDrug {drugbank_id: row.drugbank_id})
+    SET d.common_name = row.common_name,
+        d.cas_number = row.cas_number,
+        d.unii = row.unii,
+        d.synonyms = row.synonyms,
+        d.inchi_key = row.inchi_key
     """
-    tx.run(query, **drug_data)
+    tx.run(query, rows=rows).consume()
+
+
+def classify_severity(description: str, high_re=HIGH_SEVERITY_RE,
+                      moderate_re=MODERATE_SEVERITY_RE) -> str:
+    """
+    Classify interaction severity from description keywords
+    
+    Returns:
+        "HIGH", "MODERATE" or "LOW"
+    """
+    if high_re.search(description):
+        return "HIGH"
+    if moderate_re.search(description):
+        return "MODERATE"
+    return "LOW"
 
 
 def load_interactions(tx, source_id: str, target_id: str, description: str):
@@ -72,22 +120,7 @@ def load_interactions(tx, source_id: str, target_id: str, description: str):
         description: Interaction description
     """
     # Severity Detection from description text
-    severity = "LOW"
-    desc_lower = description.lower()
-    
-    # HIGH severity keywords
-    high_keywords = ['contraindicated', 'avoid', 'life-threatening', 'severe', 
-                     'dangerous', 'fatal', 'death', 'emergency', 'should not',
-                     'do not', 'never', 'serious', 'critical']
-    if any(word in desc_lower for word in high_keywords):
-        severity = "HIGH"
-    
-    # MODERATE severity keywords
-    elif any(word in desc_lower for word in 
-             ['increase', 'decrease', 'risk', 'toxicity', 'may cause',
-              'monitor', 'caution', 'adverse', 'affect', 'may', 'potential',
-              'recommended', 'consider', 'adjustment', 'dose']):
-        severity = "MODERATE"
+    severity = classify_severity(description, HIGH_SEVERITY_EXTENDED_RE, MODERATE_SEVERITY_EXTENDED_RE)
     
     query = """
     MATCH (d1:DrugBankDrug {drugbank_id: $source_id})
@@ -97,38 +130,126 @@ def load_interactions(tx, source_id: str, target_id: str, description: str):
         i.severity = $severity
     """
     tx.run(query, source_id=source_id, target_id=target_id, 
-           description=description, severity=severity)
+           description=description, severity=severity).consume()
+
+
+# Per-row statement for apoc.periodic.iterate (passed as the $inner parameter)
+INTERACTION_MERGE = """
+    WITH item, CASE
+        WHEN item.description =~ $high THEN "HIGH"
+        WHEN item.description =~ $moderate THEN "MODERATE"
+        ELSE "LOW"
+    END AS severity
+    MATCH (d1:DrugBankDrug) WHERE elementId(d1) = item.source_eid
+    MATCH (d2:DrugBankDrug) WHERE elementId(d2) = item.target_eid
+    MERGE (d1)-[i:INTERACTS_WITH]-(d2)
+    SET i.description = item.description,
+        i.severity = severity
+"""
+
+ITERATE_INTERACTIONS = """
+CALL apoc.periodic.iterate($outer, $inner,
+    {batchSize: 1000, parallel: true, concurrency: 8, retries: 3,
+     params: {batch: $batch, url: $url, high: $high, moderate: $moderate}})
+YIELD total, failedOperations, errorMessages
+RETURN total, failedOperations, errorMessages
+"""
 
 
-def load_interactions_batch(tx, interactions: list):
+def _iterate_interactions(session, outer: str, batch: list = None, url: str = None) -> int:
     """
-    Load multiple interactions in one transaction (MUCH FASTER!)
+    Run INTERACTION_MERGE for every item produced by `outer` in parallel server-side transactions
     
-    Args:
-        tx: Neo4j transaction
-        interactions: List of (source_id, target_id, description, severity) tuples
+    apoc.periodic.iterate splits the rows into 1000-row transactions and runs
+    them on several cores; retries absorb lock conflicts between transactions
+    touching the same (hub) drug. Needs an auto-commit session, not a managed tx.
+    Severity is classified server-side from the description (same keywords as
+    classify_severity()).
+    
+    Returns:
+        Number of rows that failed after retries
     """
-    query = """
-    UNWIND $batch as item
-    MATCH (d1:DrugBankDrug {drugbank_id: item.source_id})
-    MATCH (d2:DrugBankDrug {drugbank_id: item.target_id})
-    MERGE (d1)-[i:INTERACTS_WITH]-(d2)
-    SET i.description = item.description,
-        i.severity = item.severity
+    record = session.run(ITERATE_INTERACTIONS, outer=outer, inner=INTERACTION_MERGE,
+                         batch=batch, url=url,
+                         high=HIGH_SEVERITY_PATTERN,
+                         moderate=MODERATE_SEVERITY_PATTERN).single()
+    if record["failedOperations"]:
+        print(f"   ⚠️  {record['failedOperations']} interactions failed: {record['errorMessages']}")
+    return record["failedOperations"]
+
+
+def fetch_drug_element_ids(session) -> dict:
+    """
+    Map every loaded DrugBank ID to its node's element id
+    
+    Read once before Phase 3 so the interaction MERGE can seek nodes directly
+    by element id instead of two drugbank_id index lookups per row.
+    """
+    result = session.run("""
+        MATCH (d:DrugBankDrug)
+        RETURN d.drugbank_id AS drugbank_id, elementId(d) AS eid
+    """)
+    return {record["drugbank_id"]: record["eid"] for record in result}
+
+
+def load_interactions_batch(session, interactions: list) -> int:
     """
+    Load a megabatch of interactions with parallel server-side transactions
+    
+    Args:
+        session: Neo4j session
+        interactions: List of (source_eid, target_eid, description) tuples
+            (element ids from fetch_drug_element_ids())
     
+    Returns:
+        Number of rows that failed after retries
+    """
     # Convert tuples to dicts
     batch_data = [
         {
-            'source_id': source_id,
-            'target_id': target_id,
-            'description': description,
-            'severity': severity
+            'source_eid': source_eid,
+            'target_eid': target_eid,
+            'description': description
         }
-        for source_id, target_id, description, severity in interactions
+        for source_eid, target_eid, description in interactions
     ]
     
-    tx.run(query, batch=batch_data)
+    return _iterate_interactions(session, "UNWIND $batch AS item RETURN item", batch=batch_data)
+
+
+def write_interactions_csv(batches, path: str) -> int:
+    """
+    Write interaction batches to a CSV file for LOAD CSV
+    
+    Args:
+        batches: Iterable of lists of (source_eid, target_eid, description) tuples
+        path: Output path (inside the Neo4j import directory)
+    
+    Returns:
+        Number of rows written
+    """
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['source_eid', 'target_eid', 'description'])
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def load_interactions_csv(session, url: str) -> int:
+    """
+    Load interactions from a CSV in the Neo4j import directory (no Bolt payload)
+    
+    Args:
+        session: Neo4j session
+        url: LOAD CSV url, e.g. file:///drugbank_interactions.csv
+    
+    Returns:
+        Number of rows that failed after retries
+    """
+    return _iterate_interactions(session, "LOAD CSV WITH HEADERS FROM $url AS item RETURN item", url=url)
 
 
 def map_synthea_to_drugbank(tx, csv_loader: DrugBankCSVLoader) -> tuple[int, list]:
@@ -155,49 +276,56 @@ def map_synthea_to_drugbank(tx, csv_loader: DrugBankCSVLoader) -> tuple[int, lis
     
     print(f"   Found {len(medications)} Synthea medications")
     
-    # 2. Prepare mapping query
-    mapping_query = """
-    MATCH (m:Medication {code: $med_code})
-    MATCH (d:DrugBankDrug {drugbank_id: $drugbank_id})
-    MERGE (m)-[r:MAPPED_TO]->(d)
-    SET r.confidence = $confidence,
-        r.method = $method,
-        r.extracted_name = $extracted_name
-    """
+    # 2. Extract drug names (vectorized) and search each unique name once, as one batch
+    descriptions = [med["description"] for med in medications]
+    extracted_names = csv_loader.extract_drug_names_from_synthea(descriptions)
+    unique_names = list(dict.fromkeys(extracted_names))
+    best_matches = dict(zip(unique_names, csv_loader.search_by_name_batch(unique_names, threshold=0.85)))
     
-    mapped_count = 0
+    mapping_rows = []
+    mapping_lines = []  # debug output, written once after the loop
+    drug_names = {}
     unmapped = []
     
     # 3. Map each medication
-    for med in medications:
-        # Extract drug name from Synthea description
-        extracted_name = csv_loader.extract_drug_name_from_synthea(med["description"])
+    for med, extracted_name in zip(medications, extracted_names):
+        match = best_matches[extracted_name]
         
-        # Search in DrugBank CSV
-        matches = csv_loader.search_by_name(extracted_name, threshold=0.85)
-        
-        if matches:
+        if match:
             # Take best match (highest confidence)
-            best_drugbank_id, confidence = matches[0]
-            
-            # Create MAPPED_TO relationship
-            tx.run(mapping_query,
-                   med_code=med["code"],
-                   drugbank_id=best_drugbank_id,
-                   confidence=confidence,
-                   method="csv_lookup",
-                   extracted_name=extracted_name)
+            best_drugbank_id, confidence = match
             
-            mapped_count += 1
+            mapping_rows.append({
+                "med_code": med["code"],
+                "drugbank_id": best_drugbank_id,
+                "confidence": confidence,
+                "extracted_name": extracted_name
+            })
             
             # Debug output (show mapping)
-            drug_info = csv_loader.get_drug_by_id(best_drugbank_id)
+            if best_drugbank_id not in drug_names:
+                drug_names[best_drugbank_id] = csv_loader.get_drug_by_id(best_drugbank_id)['Common name']
             synthea_short = med['description'][:40]
-            drugbank_name = drug_info['Common name']
-            print(f"   ✅ {synthea_short:<40} → {drugbank_name:<20} (conf: {confidence:.2f})")
+            drugbank_name = drug_names[best_drugbank_id]
+            mapping_lines.append(f"   ✅ {synthea_short:<40} → {drugbank_name:<20} (conf: {confidence:.2f})\n")
         else:
             unmapped.append((med["description"], extracted_name))
     
+    # One buffered write instead of a print per medication
+    sys.stdout.write(''.join(mapping_lines))
+    
+    # 4. Create all MAPPED_TO relationships with one UNWIND
+    tx.run("""
+        UNWIND $rows AS row
+        MATCH (m:Medication {code: row.med_code})
+        MATCH (d:DrugBankDrug {drugbank_id: row.drugbank_id})
+        MERGE (m)-[r:MAPPED_TO]->(d)
+        SET r.confidence = row.confidence,
+            r.method = "csv_lookup",
+            r.extracted_name = row.extracted_name
+    """, rows=mapping_rows).consume()
+    mapped_count = len(mapping_rows)
+    
     return mapped_count, unmapped
 
 
@@ -267,22 +395,24 @@ def main():
                 drug_count = 0
                 total_drugs = len(drugs_df)
                 
-                for _, row in drugs_df.iterrows():
-                    drug_data = {
-                        'drugbank_id': row['DrugBank ID'],
-                        'common_name': row['Common name'],
-                        'cas_number': str(row.get('CAS', '')),
-                        'unii': str(row.get('UNII', '')),
-                        'synonyms': str(row.get('Synonyms', '')),
-                        'inchi_key': str(row.get('Standard InChI Key', ''))
-                    }
-                    
-                    session.execute_write(load_drugbank_drugs, drug_data)
-                    drug_count += 1
+                # Build all rows once (column-wise), then write them in UNWIND batches.
+                # All phases share this session, so its bookmarks chain the writes causally.
+                drug_rows = drugs_df[['DrugBank ID', 'Common name']].rename(columns={
+                    'DrugBank ID': 'drugbank_id',
+                    'Common name': 'common_name'
+                })
+                for column, key in [('CAS', 'cas_number'), ('UNII', 'unii'),
+                                    ('Synonyms', 'synonyms'), ('Standard InChI Key', 'inchi_key')]:
+                    drug_rows[key] = drugs_df[column].map(str) if column in drugs_df else ''
+                drug_rows = drug_rows.to_dict('records')
+                
+                for i in range(0, total_drugs, DRUG_BATCH_SIZE):
+                    batch = drug_rows[i:i + DRUG_BATCH_SIZE]
+                    session.execute_write(load_drugbank_drugs_batch, batch)
+                    drug_count += len(batch)
                     
-                    if drug_count % 1000 == 0:
-                        progress = (drug_count / total_drugs) * 100
-                        print(f"   📊 Progress: {drug_count:,}/{total_drugs:,} drugs ({progress:.1f}%)", flush=True)
+                    progress = (drug_count / total_drugs) * 100
+                    print(f"   📊 Progress: {drug_count:,}/{total_drugs:,} drugs ({progress:.1f}%)")
                 
                 print(f"✅ {drug_count:,} drugs loaded from CSV")
                 
@@ -316,54 +446,93 @@ def main():
                 interaction_parser = DrugBankInteractionParser(DRUGBANK_XML)
                 interaction_count = 0
                 estimated_total = 2_800_000  # Estimated total interactions
-                batch_size = 5000  # Process 5000 interactions per transaction (MUCH FASTER!)
-                batch = []
+                batch_size = 50000  # Megabatch per call, split server-side into parallel 1000-row transactions
                 
                 if test_mode:
                     print(f"   🧪 TEST MODE: Loading only first {test_interactions} interactions")
-                    interaction_generator = interaction_parser.parse_first_n_interactions(test_interactions)
+                    interaction_chunks = [interaction_parser.parse_first_n_interactions(test_interactions)]
                     batch_size = 10  # Smaller batches for testing
                 else:
                     print(f"   🚀 Starting interaction import (estimated: {estimated_total:,})")
-                    print(f"   💡 Using batch processing ({batch_size:,} interactions per transaction)")
-                    interaction_generator = interaction_parser.parse_interactions()
+                    print(f"   💡 Using parallel batch processing ({batch_size:,} interactions per call)")
+                    # Parsed lists are handed over whole (no generator resume per interaction).
+                    # The worker pool is forked here, in the main thread; prefetch() below
+                    # only consumes the result iterator
+                    interaction_chunks = interaction_parser.parse_interactions_batched(batch_size, parallel=True)
                 
                 import time
-                start_time = time.time()
+                start_time = time.monotonic()
                 
-                for source_id, target_id, description in interaction_generator:
-                    # Add to batch with severity detection
-                    desc_lower = description.lower()
-                    if any(kw in desc_lower for kw in ['contraindicated', 'avoid', 'life-threatening', 'severe', 'dangerous', 'fatal', 'death']):
-                        severity = "HIGH"
-                    elif any(kw in desc_lower for kw in ['increase', 'decrease', 'risk', 'toxicity', 'monitor', 'caution', 'may cause']):
-                        severity = "MODERATE"
-                    else:
-                        severity = "LOW"
-                    
-                    batch.append((source_id, target_id, description, severity))
-                    interaction_count += 1
+                # DrugBank lists every interaction under both drugs; INTERACTS_WITH is
+                # merged undirected, so the mirrored copy is skipped instead of re-sent
+                seen_pairs = set()
+                duplicate_count = 0
+                
+                # Interactions whose drugs are not loaded (not in the vocabulary CSV) are
+                # dropped here; the old MATCH-based MERGE silently matched nothing for them
+                drug_eids = fetch_drug_element_ids(session)
+                orphan_count = 0
+                
+                def report_progress():
+                    """One progress line per handed-over batch (not a check per interaction)"""
+                    if test_mode:
+                        print(f"   📊 Test Progress: {interaction_count}/{test_interactions} interactions")
+                        return
+                    elapsed = time.monotonic() - start_time
+                    rate = interaction_count / elapsed if elapsed > 0 else 0
+                    remaining = max(estimated_total - interaction_count, 0) / rate if rate > 0 else 0
+                    progress = (interaction_count / estimated_total) * 100
+                    print(f"   📊 Progress: {interaction_count:,}/{estimated_total:,} ({progress:.1f}%) | Rate: {rate:,.0f}/sec | ETA: {remaining/60:.1f} min")
+                
+                def interaction_batches():
+                    """Parse, deduplicate and group interactions into write batches"""
+                    nonlocal interaction_count, duplicate_count, orphan_count
+                    batch = []
                     
-                    # Process batch when full
-                    if len(batch) >= batch_size:
-                        session.execute_write(load_interactions_batch, batch)
-                        batch = []
+                    for chunk in interaction_chunks:
+                        interaction_count += len(chunk)
+                        for source_id, target_id, description in chunk:
+                            pair = (source_id, target_id) if source_id < target_id else (target_id, source_id)
+                            if pair in seen_pairs:
+                                duplicate_count += 1
+                                continue
+                            seen_pairs.add((sys.intern(pair[0]), sys.intern(pair[1])))
+                            
+                            source_eid = drug_eids.get(source_id)
+                            target_eid = drug_eids.get(target_id)
+                            if source_eid is None or target_eid is None:
+                                orphan_count += 1
+                            else:
+                                # Add to batch (severity is classified server-side)
+                                batch.append((source_eid, target_eid, description))
+                            
+                            # Hand over batch when full
+                            if len(batch) >= batch_size:
+                                report_progress()
+                                yield batch
+                                batch = []
                     
-                    # Progress reporting
-                    if test_mode and interaction_count % 10 == 0:
-                        print(f"   📊 Test Progress: {interaction_count}/{test_interactions} interactions", flush=True)
-                    elif not test_mode and interaction_count % 50000 == 0:
-                        elapsed = time.time() - start_time
-                        rate = interaction_count / elapsed if elapsed > 0 else 0
-                        remaining = (estimated_total - interaction_count) / rate if rate > 0 else 0
-                        progress = (interaction_count / estimated_total) * 100
-                        print(f"   📊 Progress: {interaction_count:,}/{estimated_total:,} ({progress:.1f}%) | Rate: {rate:,.0f}/sec | ETA: {remaining/60:.1f} min", flush=True)
+                    # Remaining batch
+                    if batch:
+                        yield batch
                 
-                # Process remaining batch
-                if batch:
-                    session.execute_write(load_interactions_batch, batch)
+                if USE_LOAD_CSV:
+                    # Stream to the import dir, then one server-side load (no Bolt payload)
+                    rows = write_interactions_csv(interaction_batches(), INTERACTIONS_CSV)
+                    print(f"   📄 Wrote {rows:,} interactions to {INTERACTIONS_CSV}, loading with LOAD CSV...")
+                    failed_count = load_interactions_csv(session, INTERACTIONS_CSV_URL)
+                else:
+                    # Parsing runs in a background thread while Neo4j commits the previous batch
+                    failed_count = sum(load_interactions_batch(session, batch)
+                                       for batch in prefetch(interaction_batches(), maxsize=4))
                 
-                total_time = time.time() - start_time
+                # Rows that still failed after the retries are not in the graph
+                interaction_count -= failed_count
+                total_time = time.monotonic() - start_time
+                print(f"   ⏭️  Skipped {duplicate_count:,} mirrored duplicates")
+                print(f"   ⏭️  Skipped {orphan_count:,} interactions with drugs not in the database")
+                if failed_count:
+                    print(f"   ❌ {failed_count:,} interactions failed after retries")
                 print(f"✅ {interaction_count:,} interactions loaded in {total_time/60:.1f} minutes")
             else:
                 print("\n⚠️  XML not found - Skipping interactions")
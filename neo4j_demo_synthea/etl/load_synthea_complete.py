@@ -9,7 +9,7 @@ import os
 # Add modules directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from modules.base import Neo4jConnection, get_stats, print_stats, IMPORT_DIR
+from modules.base import Neo4jConnection, ensure_constraints, get_stats, print_stats, IMPORT_DIR
 from modules.patients import load_patients
 
 # OPTIMIZED IMPORTS - Same data structure, 150x faster!
@@ -35,26 +35,7 @@ def create_constraints(connection):
     print("Creating Constraints")
     print("=" * 60)
     
-    constraints = [
-        "CREATE CONSTRAINT patient_id IF NOT EXISTS FOR (p:Patient) REQUIRE p.patient_id IS UNIQUE",
-        "CREATE CONSTRAINT encounter_id IF NOT EXISTS FOR (e:Encounter) REQUIRE e.encounter_id IS UNIQUE",
-        "CREATE CONSTRAINT condition_code IF NOT EXISTS FOR (c:Condition) REQUIRE c.code IS UNIQUE",
-        "CREATE CONSTRAINT medication_code IF NOT EXISTS FOR (m:Medication) REQUIRE m.code IS UNIQUE",
-        "CREATE CONSTRAINT procedure_code IF NOT EXISTS FOR (p:Procedure) REQUIRE p.code IS UNIQUE",
-        # NOTE: Observations are individual measurements, NOT unique by code (many patients have same code)
-        # "CREATE CONSTRAINT observation_code IF NOT EXISTS FOR (o:Observation) REQUIRE o.code IS UNIQUE",
-        "CREATE CONSTRAINT provider_id IF NOT EXISTS FOR (prov:Provider) REQUIRE prov.provider_id IS UNIQUE",
-        "CREATE CONSTRAINT organization_id IF NOT EXISTS FOR (org:Organization) REQUIRE org.organization_id IS UNIQUE",
-        "CREATE CONSTRAINT payer_id IF NOT EXISTS FOR (pay:Payer) REQUIRE pay.payer_id IS UNIQUE",
-        "CREATE CONSTRAINT immunization_id IF NOT EXISTS FOR (i:Immunization) REQUIRE (i.patient_id, i.date, i.code) IS UNIQUE",
-    ]
-    
-    for constraint in constraints:
-        try:
-            connection.run_query(constraint)
-        except Exception as e:
-            if "EquivalentSchemaRuleAlreadyExists" not in str(e):
-                print(f"Warning: {e}")
+    ensure_constraints(connection)
     
     print("✓ Constraints created")
 
@@ -66,28 +47,37 @@ def clear_database(connection):
     
     # First drop all constraints (needed for clean import)
     try:
-        constraints_result = connection.run_query("SHOW CONSTRAINTS")
-        for constraint in constraints_result:
-            constraint_name = constraint['name']
-            try:
-                connection.run_query(f"DROP CONSTRAINT {constraint_name}")
+        constraint_names = [c['name'] for c in connection.run_query("SHOW CONSTRAINTS YIELD name")]
+        try:
+            # All drops in one transaction
+            connection.run_queries([f"DROP CONSTRAINT `{name}` IF EXISTS" for name in constraint_names])
+            for constraint_name in constraint_names:
                 print(f"  Dropped constraint: {constraint_name}")
-            except Exception as e:
-                print(f"  Warning dropping constraint {constraint_name}: {e}")
+        except Exception:
+            for constraint_name in constraint_names:
+                try:
+                    connection.run_query(f"DROP CONSTRAINT `{constraint_name}` IF EXISTS")
+                    print(f"  Dropped constraint: {constraint_name}")
+                except Exception as e:
+                    print(f"  Warning dropping constraint {constraint_name}: {e}")
     except Exception as e:
         print(f"  Warning listing constraints: {e}")
     
-    # Then delete all nodes in batches (prevents memory overflow)
+    # Then delete all nodes in server-side batches (prevents memory overflow)
     print("  Deleting nodes in batches...")
-    deleted_total = 0
-    while True:
-        result = connection.run_query("MATCH (n) WITH n LIMIT 10000 DETACH DELETE n RETURN count(n) as deleted")
-        deleted = result[0]['deleted'] if result else 0
-        deleted_total += deleted
-        if deleted == 0:
-            break
-        if deleted_total % 100000 == 0:
-            print(f"    Deleted {deleted_total} nodes...")
+    deleted_total = connection.run_query("MATCH (n) RETURN count(n) as total")[0]['total']
+    try:
+        connection.run_query("""
+            MATCH (n)
+            CALL (n) { DETACH DELETE n } IN 8 CONCURRENT TRANSACTIONS OF 10000 ROWS
+        """)
+    except Exception as e:
+        # Older servers (< 5.21) or lock conflicts between concurrent batches: finish serially
+        print(f"  Warning: concurrent delete failed, continuing serially: {e}")
+        connection.run_query("""
+            MATCH (n)
+            CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+        """)
     
     print(f"✓ Database cleared ({deleted_total} nodes deleted)")
 
@@ -3,9 +3,16 @@ Base utilities for ETL modules
 Provides common functions and connection handling
 """
 
+import atexit
 import os
+import queue
+import threading
 import time
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 from neo4j import GraphDatabase
 
 # Configuration
@@ -13,6 +20,26 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://neo4j-synthea:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "synthea123")
 IMPORT_DIR = "/import"  # Changed from "/import/synthea" to "/import"
+TX_BATCHES = 10  # UNWIND batches per write transaction (one commit per group instead of per batch)
+WRITE_WORKERS = int(os.getenv("NEO4J_WRITE_WORKERS", "8"))  # concurrent write sessions (pooled connections)
+# Let Neo4j read the Synthea CSVs itself (LOAD CSV) instead of parsing and sending them from Python.
+# The server's import dir is the same ./import directory mounted at IMPORT_DIR here.
+SERVER_SIDE_LOAD = os.getenv("ETL_SERVER_SIDE_LOAD", "false").lower() == "true"
+
+# Uniqueness constraints; their backing range indexes serve the MATCH/MERGE lookups of the loaders
+CONSTRAINTS = [
+    "CREATE CONSTRAINT patient_id IF NOT EXISTS FOR (p:Patient) REQUIRE p.patient_id IS UNIQUE",
+    "CREATE CONSTRAINT encounter_id IF NOT EXISTS FOR (e:Encounter) REQUIRE e.encounter_id IS UNIQUE",
+    "CREATE CONSTRAINT condition_code IF NOT EXISTS FOR (c:Condition) REQUIRE c.code IS UNIQUE",
+    "CREATE CONSTRAINT medication_code IF NOT EXISTS FOR (m:Medication) REQUIRE m.code IS UNIQUE",
+    "CREATE CONSTRAINT procedure_code IF NOT EXISTS FOR (p:Procedure) REQUIRE p.code IS UNIQUE",
+    # NOTE: Observations are individual measurements, NOT unique by code (many patients have same code)
+    # "CREATE CONSTRAINT observation_code IF NOT EXISTS FOR (o:Observation) REQUIRE o.code IS UNIQUE",
+    "CREATE CONSTRAINT provider_id IF NOT EXISTS FOR (prov:Provider) REQUIRE prov.provider_id IS UNIQUE",
+    "CREATE CONSTRAINT organization_id IF NOT EXISTS FOR (org:Organization) REQUIRE org.organization_id IS UNIQUE",
+    "CREATE CONSTRAINT payer_id IF NOT EXISTS FOR (pay:Payer) REQUIRE pay.payer_id IS UNIQUE",
+    "CREATE CONSTRAINT immunization_id IF NOT EXISTS FOR (i:Immunization) REQUIRE (i.patient_id, i.date, i.code) IS UNIQUE",
+]
 
 class Neo4jConnection:
     """Manages Neo4j database connection with retry logic"""
@@ -50,15 +77,342 @@ class Neo4jConnection:
             result = session.run(query, parameters or {})
             return [record.data() for record in result]
     
+    def run_queries(self, queries):
+        """Execute several Cypher statements in one transaction (one round trip to commit)"""
+        def run_all(tx):
+            for query in queries:
+                tx.run(query).consume()
+        
+        with self.driver.session() as session:
+            session.execute_write(run_all)
+    
+    def write_batches(self, query, rows, batch_size=5000):
+        """
+        Run an UNWIND $rows query over `rows` in batches, one write transaction per batch
+        
+        Returns:
+            Number of rows sent
+        """
+        total = 0
+        with self.driver.session() as session:
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                session.execute_write(lambda tx: tx.run(query, rows=batch).consume())
+                total += len(batch)
+        return total
+    
+    def bulk_merge(self, label, key, rows, batch_size=5000):
+        """
+        MERGE nodes of `label` by `key` from a list of property dicts (UNWIND batches)
+        
+        Every field of a row is set on its node; None values are not stored.
+        Needs a uniqueness constraint on (label, key) to seek instead of scan.
+        """
+        query = f"""
+            UNWIND $rows AS row
+            MERGE (n:{label} {{{key}: row.{key}}})
+            SET n += row
+        """
+        return self.write_batches(query, rows, batch_size)
+    
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+_shared_connection = None
+_shared_connection_lock = threading.Lock()
+
+def get_connection():
+    """
+    Process-wide Neo4jConnection, created on first use and closed at exit
+    
+    Loaders called without a connection share this driver (and its connection
+    pool) instead of each opening, verifying and closing their own.
+    """
+    global _shared_connection
+    with _shared_connection_lock:
+        if _shared_connection is None:
+            _shared_connection = Neo4jConnection()
+            atexit.register(_shared_connection.close)
+        return _shared_connection
+
+def prefetch(iterable, maxsize=4):
+    """
+    Iterate in a background thread, keeping up to `maxsize` items ready
+    
+    Lets producing the next item (e.g. parsing a batch) overlap with consuming
+    the current one (e.g. a Neo4j commit). Producer exceptions are re-raised
+    in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+    
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((None, e))
+        finally:
+            items.put((done, None))
+    
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is done:
+            return
+        yield item
+
+def ensure_constraints(connection):
+    """
+    Create the lookup constraints (no-op if they exist) and wait until their indexes are online
+    
+    Called by the bulk loaders, so a standalone run never falls back to label
+    scans for its MATCH lookups.
+    """
+    # All schema statements in one transaction; fall back to one by one for warnings
+    try:
+        connection.run_queries(CONSTRAINTS)
+    except Exception:
+        for constraint in CONSTRAINTS:
+            try:
+                connection.run_query(constraint)
+            except Exception as e:
+                if "EquivalentSchemaRuleAlreadyExists" not in str(e):
+                    print(f"Warning: {e}")
+    connection.run_query("CALL db.awaitIndexes(300)")
+
+# Appended after CALL { ... } IN TRANSACTIONS ... ON ERROR CONTINUE: one status per input row,
+# so the rows of skipped inner transactions can be counted instead of vanishing silently
+REPORT_FAILED_ROWS = """
+    REPORT STATUS AS s
+    WITH s WHERE NOT s.committed
+    RETURN count(*) AS failed, collect(DISTINCT s.errorMessage)[..3] AS errors
+"""
+
+def load_csv_server_side(connection, file_name, row_query, batch_size, on_error="FAIL",
+                         counter="nodes_created"):
+    """
+    Load a CSV from the Neo4j import directory with LOAD CSV ... CALL IN TRANSACTIONS
+    
+    One round trip: the server reads and commits the file in transactions of
+    `batch_size` rows. LOAD CSV yields strings (empty fields as null), so
+    `row_query` converts types itself.
+    
+    Args:
+        on_error: FAIL (abort on the first failing transaction) or CONTINUE (skip
+            it; the number of skipped rows and their errors are printed)
+        counter: Summary counter to return (e.g. relationships_created)
+    
+    Returns:
+        Number of created nodes, or the given counter (from the result summary, no RETURN needed)
+    """
+    report = REPORT_FAILED_ROWS if on_error == "CONTINUE" else ""
+    with connection.driver.session() as session:
+        result = session.run(f"""
+            LOAD CSV WITH HEADERS FROM $url AS row
+            CALL (row) {{
+                {row_query}
+            }} IN TRANSACTIONS OF $rows ROWS ON ERROR {on_error}
+            {report}
+        """, url=f"file:///{file_name}", rows=batch_size)
+        if report:
+            record = result.single()
+            if record["failed"]:
+                print(f"Error: {record['failed']} rows of {file_name} failed and were skipped: {record['errors']}")
+        summary = result.consume()
+        return getattr(summary.counters, counter)
+
+def row_count(group):
+    """Rows in a record group: a list of row dicts or a columnar dict {column: [values]}"""
+    if isinstance(group, dict):
+        return len(next(iter(group.values()), []))
+    return len(group)
+
+def split_batches(group, batch_size):
+    """Slice a record group (row list or columnar dict) into batches of `batch_size` rows"""
+    for i in range(0, row_count(group), batch_size):
+        if isinstance(group, dict):
+            yield {column: values[i:i + batch_size] for column, values in group.items()}
+        else:
+            yield group[i:i + batch_size]
+
+def write_batch_group(tx, query, records, batch_size):
+    """
+    Transaction function: send `records` as several UNWIND $batch queries in one transaction
+    
+    Use with session.execute_write(write_batch_group, query, group, batch_size),
+    so the group commits once and is retried as a whole on transient errors.
+    `records` is a list of row dicts, or a columnar dict of equal-length lists
+    (then the query unwinds range(0, size($batch.<column>) - 1)). Queries need
+    no RETURN: results are discarded with consume().
+    
+    Returns:
+        Number of rows written
+    """
+    for batch in split_batches(records, batch_size):
+        tx.run(query, batch=batch).consume()
+    return row_count(records)
+
+def write_groups_parallel(driver, query, groups, batch_size, max_workers=WRITE_WORKERS):
+    """
+    Write record groups concurrently, each in its own session and transaction
+    
+    Sessions borrow separate connections from the driver pool, so up to
+    `max_workers` groups commit at the same time. Deadlocks between groups that
+    touch the same nodes are transient errors and retried by execute_write.
+    At most 2 * max_workers groups are held in memory.
+    
+    Yields:
+        The row count of each group as it commits (completion order)
+    """
+    def write(group):
+        with driver.session() as session:
+            return session.execute_write(write_batch_group, query, group, batch_size)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for group in groups:
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(write, group))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def write_partitions_parallel(driver, query, df, key, batch_size, max_workers=WRITE_WORKERS):
+    """
+    Write a DataFrame concurrently, hash-partitioned by the `key` column
+    
+    All rows with the same key land in one partition, which a single session
+    writes in file order (TX_BATCHES batches per transaction). Partition by the
+    shared node of the written pattern (e.g. the Medication code): each such node
+    is then locked by one session only, and MERGE ... SET on its relationships
+    ends with the same values as a sequential load.
+    
+    A partition stops at a transaction that still fails after execute_write's
+    retries; its remaining groups are re-run in order, one session, once the
+    other partitions are done. A second failure raises - no rows are skipped.
+    
+    Yields:
+        The number of rows written by each partition (completion order), then
+        by the re-run of stopped partitions
+    """
+    partitions = pd.util.hash_pandas_object(df[key], index=False).to_numpy() % max_workers
+    
+    def write(part):
+        written = 0
+        groups = iter_record_batches(part, batch_size * TX_BATCHES)
+        with driver.session() as session:
+            for group in groups:
+                try:
+                    written += session.execute_write(write_batch_group, query, group, batch_size)
+                except Exception as e:
+                    print(f"⚠️  Partition stopped at a failed transaction, re-running it later: {e}")
+                    return written, [group, *groups]
+        return written, []
+    
+    stopped = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write, df[partitions == i]) for i in range(max_workers)]
+        for future in as_completed(futures):
+            written, remaining = future.result()
+            if remaining:
+                stopped.append(remaining)
+            yield written
+    
+    for remaining in stopped:
+        written = 0
+        with driver.session() as session:
+            for group in remaining:
+                try:
+                    written += session.execute_write(write_batch_group, query, group, batch_size)
+                except Exception as e:
+                    raise RuntimeError(f"Write failed again for {row_count(group)} rows") from e
+        yield written
+
+def iter_record_batches(df, batch_size):
+    """
+    Yield the rows of `df` as lists of at most `batch_size` dicts
+    
+    Rows are built lazily from itertuples(), so only one batch of dicts is
+    alive at a time instead of the whole table from to_dict('records').
+    """
+    columns = list(df.columns)
+    rows = df.itertuples(index=False, name=None)
+    while True:
+        batch = [dict(zip(columns, values)) for values in islice(rows, batch_size)]
+        if not batch:
+            return
+        yield batch
+
 def clean_dataframe(df):
-    """Replace NaN values with None for proper Neo4j null handling"""
-    return df.where(pd.notna(df), None)
+    """
+    Replace NaN values with None for proper Neo4j null handling
+    
+    One vectorized null mask; only columns that contain nulls are converted to
+    object dtype (NaN would otherwise reach Neo4j as a float, not as null).
+    Columns without nulls keep their numeric dtype.
+    """
+    nulls = df.isna()
+    columns = nulls.columns[nulls.any()]
+    if len(columns) == 0:
+        return df
+    df = df.astype({column: object for column in columns})
+    df[columns] = df[columns].where(~nulls[columns], None)
+    return df
+
+def read_csv_arrow(path, string_columns=()):
+    """
+    Read a CSV with pyarrow's multithreaded C++ reader into a DataFrame
+    
+    Same columns, dtypes and nulls as pd.read_csv(path). string_columns are
+    kept as text: Arrow would otherwise turn ISO date columns into timestamps.
+    """
+    table = pv.read_csv(path, convert_options=pv.ConvertOptions(
+        column_types={column: pa.string() for column in string_columns},
+        strings_can_be_null=True))
+    return table.to_pandas()
+
+def to_datetimes(df, columns):
+    """
+    Parse ISO date/datetime string columns once in pandas (vectorized)
+    
+    Values become timezone-aware (UTC) timestamps that the driver sends as
+    native Neo4j DateTime, so Cypher can store row.START instead of parsing
+    datetime(row.START) per row. Missing or unparsable values become None.
+    """
+    converted = {}
+    for column in columns:
+        if column in df.columns:
+            parsed = pd.to_datetime(df[column], utc=True, format='ISO8601', errors='coerce')
+            converted[column] = parsed.astype(object).where(parsed.notna(), None)
+    return df.assign(**converted)
+
+def code_descriptions(df, seen=None):
+    """
+    One (CODE, DESCRIPTION) row per code for the reference-node MERGE ... SET
+    
+    Keeps the description that SETs over the distinct pairs (in order of first
+    appearance) leave behind: the last distinct pair per code, not the last row.
+    
+    Args:
+        seen: Pairs from earlier chunks of the same file (updated in place);
+            they are dropped, as their SET already ran
+    """
+    pairs = df[['CODE', 'DESCRIPTION']].drop_duplicates()
+    if seen is not None:
+        keys = list(zip(pairs['CODE'], pairs['DESCRIPTION']))
+        pairs = pairs[[key not in seen for key in keys]]
+        seen.update(keys)
+    return pairs.drop_duplicates(subset='CODE', keep='last')
 
 def safe_date(date_str):
     """Safely convert date string, handling None/empty values"""
@@ -72,28 +426,26 @@ def safe_datetime(datetime_str):
         return None
     return str(datetime_str)
 
+# Labels and relationship types counted by get_stats()
+STATS_NODE_LABELS = ["Patient", "Encounter", "Condition", "Medication", "Procedure", 
+                     "Observation", "Provider", "Organization", "Payer", "Allergy", 
+                     "CarePlan", "Device", "ImagingStudy", "Immunization"]
+
+STATS_REL_TYPES = ["HAD_ENCOUNTER", "HAS_CONDITION", "TAKES_MEDICATION", "PRESCRIBED", 
+                   "DIAGNOSED", "PERFORMED", "ORDERED", "SEEN_BY", "AT_ORGANIZATION", 
+                   "WORKS_AT", "HAS_ALLERGY", "HAS_CAREPLAN", "HAS_DEVICE", 
+                   "HAD_IMAGING", "RECEIVED_IMMUNIZATION", "COVERED_BY"]
+
 def get_stats(connection):
-    """Get database statistics"""
-    stats = {}
-    
-    # Node counts
-    node_labels = ["Patient", "Encounter", "Condition", "Medication", "Procedure", 
-                   "Observation", "Provider", "Organization", "Payer", "Allergy", 
-                   "CarePlan", "Device", "ImagingStudy", "Immunization"]
+    """Get database statistics (all counts in one UNION ALL query, one round trip)"""
+    parts = [f"MATCH (n:{label}) RETURN '{label}' AS key, count(n) AS count"
+             for label in STATS_NODE_LABELS]
+    parts += [f"MATCH ()-[r:{rel_type}]->() RETURN '{rel_type}' AS key, count(r) AS count"
+              for rel_type in STATS_REL_TYPES]
     
-    for label in node_labels:
-        result = connection.run_query(f"MATCH (n:{label}) RETURN count(n) as count")
-        stats[f"{label}_count"] = result[0]['count'] if result else 0
-    
-    # Relationship counts
-    rel_types = ["HAD_ENCOUNTER", "HAS_CONDITION", "TAKES_MEDICATION", "PRESCRIBED", 
-                 "DIAGNOSED", "PERFORMED", "ORDERED", "SEEN_BY", "AT_ORGANIZATION", 
-                 "WORKS_AT", "HAS_ALLERGY", "HAS_CAREPLAN", "HAS_DEVICE", 
-                 "HAD_IMAGING", "RECEIVED_IMMUNIZATION", "COVERED_BY"]
-    
-    for rel_type in rel_types:
-        result = connection.run_query(f"MATCH ()-[r:{rel_type}]->() RETURN count(r) as count")
-        stats[f"{rel_type}_count"] = result[0]['count'] if result else 0
+    stats = {f"{key}_count": 0 for key in STATS_NODE_LABELS + STATS_REL_TYPES}
+    for record in connection.run_query(" UNION ALL ".join(parts)):
+        stats[f"{record['key']}_count"] = record['count']
     
     return stats
 
@@ -103,18 +455,21 @@ def print_stats(stats):
     print("DATABASE STATISTICS")
     print("=" * 60)
     
+    rel_keys = {f"{rel_type}_count" for rel_type in STATS_REL_TYPES}
+    node_items = sorted((key, value) for key, value in stats.items()
+                        if key.endswith('_count') and key not in rel_keys)
+    rel_items = sorted((key, value) for key, value in stats.items() if key in rel_keys)
+    
     print("\nNode Counts:")
-    for key, value in sorted(stats.items()):
-        if key.endswith('_count') and not any(rel in key for rel in ["HAD_", "HAS_", "TAKES_", "PRESCRIBED", "DIAGNOSED", "PERFORMED", "ORDERED", "SEEN_", "AT_", "WORKS_", "COVERED_", "RECEIVED_"]):
-            label = key.replace('_count', '')
-            if value > 0:
-                print(f"  {label}: {value}")
+    for key, value in node_items:
+        label = key.replace('_count', '')
+        if value > 0:
+            print(f"  {label}: {value}")
     
     print("\nRelationship Counts:")
-    for key, value in sorted(stats.items()):
-        if any(rel in key for rel in ["HAD_", "HAS_", "TAKES_", "PRESCRIBED", "DIAGNOSED", "PERFORMED", "ORDERED", "SEEN_", "AT_", "WORKS_", "COVERED_", "RECEIVED_"]):
-            rel = key.replace('_count', '')
-            if value > 0:
-                print(f"  {rel}: {value}")
+    for key, value in rel_items:
+        rel = key.replace('_count', '')
+        if value > 0:
+            print(f"  {rel}: {value}")
     
     print("\n" + "=" * 60 + "\n")
@@ -1,90 +1,82 @@
 """Organizations, Providers, Encounters, Conditions, Observations modules"""
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
+from .base import get_connection, IMPORT_DIR, clean_dataframe
 import pandas as pd
 
-def load_organizations(connection=None):
+# CSV column -> node property
+ORGANIZATION_PROPERTIES = {
+    'Id': 'organization_id', 'NAME': 'name', 'ADDRESS': 'address',
+    'CITY': 'city', 'STATE': 'state', 'ZIP': 'zip',
+    'LAT': 'lat', 'LON': 'lon', 'PHONE': 'phone',
+    'REVENUE': 'revenue', 'UTILIZATION': 'utilization'
+}
+
+PROVIDER_PROPERTIES = {
+    'Id': 'provider_id', 'NAME': 'name', 'GENDER': 'gender',
+    'SPECIALITY': 'specialty', 'ADDRESS': 'address',
+    'CITY': 'city', 'STATE': 'state', 'ZIP': 'zip',
+    'LAT': 'lat', 'LON': 'lon', 'ENCOUNTERS': 'utilization'
+}
+
+# Reference tables are a few thousand rows: send them in one UNWIND
+# (one round trip) and only paginate beyond this many rows
+REFERENCE_BATCH_SIZE = 20000
+
+def node_rows(df, properties):
+    """Rename CSV columns to node properties and return one dict per row (missing columns are skipped)"""
+    columns = {column: prop for column, prop in properties.items() if column in df.columns}
+    return df[list(columns)].rename(columns=columns).to_dict('records')
+
+def load_organizations(connection=None, batch_size=REFERENCE_BATCH_SIZE):
     print("\n" + "=" * 60)
     print("Loading Organizations")
     print("=" * 60)
     
-    close_connection = connection is None
-    if close_connection:
-        connection = Neo4jConnection()
+    if connection is None:
+        connection = get_connection()
+    
+    df = pd.read_csv(f"{IMPORT_DIR}/organizations.csv")
+    df = clean_dataframe(df)
+    print(f"Found {len(df)} organizations")
     
+    total = 0
     try:
-        df = pd.read_csv(f"{IMPORT_DIR}/organizations.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} organizations")
-        
-        total = 0
-        with connection.driver.session() as session:
-            for _, row in df.iterrows():
-                try:
-                    session.run("""
-                        CREATE (o:Organization {
-                            organization_id: $id, name: $name, address: $address,
-                            city: $city, state: $state, zip: $zip,
-                            lat: $lat, lon: $lon, phone: $phone,
-                            revenue: $revenue, utilization: $utilization
-                        })
-                    """, id=row['Id'], name=row['NAME'], address=row.get('ADDRESS'),
-                    city=row.get('CITY'), state=row.get('STATE'), zip=row.get('ZIP'),
-                    lat=row.get('LAT'), lon=row.get('LON'), phone=row.get('PHONE'),
-                    revenue=row.get('REVENUE'), utilization=row.get('UTILIZATION'))
-                    total += 1
-                except Exception as e:
-                    print(f"Error: {e}")
-        print(f"✓ Loaded {total} organizations")
-        return total
-    finally:
-        if close_connection:
-            connection.close()
+        total = connection.bulk_merge('Organization', 'organization_id',
+                                      node_rows(df, ORGANIZATION_PROPERTIES), batch_size)
+    except Exception as e:
+        print(f"Error: {e}")
+    print(f"✓ Loaded {total} organizations")
+    return total
 
-def load_providers(connection=None):
+def load_providers(connection=None, batch_size=REFERENCE_BATCH_SIZE):
     print("\n" + "=" * 60)
     print("Loading Providers")
     print("=" * 60)
     
-    close_connection = connection is None
-    if close_connection:
-        connection = Neo4jConnection()
+    if connection is None:
+        connection = get_connection()
+    
+    df = pd.read_csv(f"{IMPORT_DIR}/providers.csv")
+    df = clean_dataframe(df)
+    print(f"Found {len(df)} providers")
     
+    total = 0
     try:
-        df = pd.read_csv(f"{IMPORT_DIR}/providers.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} providers")
-        
-        total = 0
-        with connection.driver.session() as session:
-            for _, row in df.iterrows():
-                try:
-                    session.run("""
-                        CREATE (prov:Provider {
-                            provider_id: $id, name: $name, gender: $gender,
-                            specialty: $specialty, address: $address,
-                            city: $city, state: $state, zip: $zip,
-                            lat: $lat, lon: $lon, utilization: $utilization
-                        })
-                    """, id=row['Id'], name=row['NAME'], gender=row.get('GENDER'),
-                    specialty=row.get('SPECIALITY'), address=row.get('ADDRESS'),
-                    city=row.get('CITY'), state=row.get('STATE'), zip=row.get('ZIP'),
-                    lat=row.get('LAT'), lon=row.get('LON'), utilization=row.get('ENCOUNTERS'))
-                    
-                    # Link to organization
-                    session.run("""
-                        MATCH (prov:Provider {provider_id: $prov_id})
-                        MATCH (org:Organization {organization_id: $org_id})
-                        MERGE (prov)-[:WORKS_AT]->(org)
-                    """, prov_id=row['Id'], org_id=row['ORGANIZATION'])
-                    total += 1
-                except Exception as e:
-                    print(f"Error: {e}")
-        print(f"✓ Loaded {total} providers")
-        return total
-    finally:
-        if close_connection:
-            connection.close()
+        # Provider node and its organization link in the same UNWIND pass
+        rows = [{'props': props, 'org_id': org_id}
+                for props, org_id in zip(node_rows(df, PROVIDER_PROPERTIES), df['ORGANIZATION'])]
+        total = connection.write_batches("""
+            UNWIND $rows AS row
+            MERGE (prov:Provider {provider_id: row.props.provider_id})
+            SET prov += row.props
+            WITH prov, row
+            MATCH (org:Organization {organization_id: row.org_id})
+            MERGE (prov)-[:WORKS_AT]->(org)
+        """, rows, batch_size)
+    except Exception as e:
+        print(f"Error: {e}")
+    print(f"✓ Loaded {total} providers")
+    return total
 
 def load_encounters(connection=None):
     print("\n" + "=" * 60)
@@ -1,9 +1,32 @@
 """OPTIMIZED VERSION - Organizations, Providers, Encounters with BATCH processing"""
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
+from .base import (get_connection, IMPORT_DIR, REPORT_FAILED_ROWS, SERVER_SIDE_LOAD, TX_BATCHES,
+                   clean_dataframe, ensure_constraints, iter_record_batches, load_csv_server_side, prefetch,
+                   row_count, to_datetimes, write_batch_group, write_groups_parallel)
 import pandas as pd
 
-def load_encounters_optimized(connection=None, batch_size=1000):
+def read_record_groups(path, chunk_rows, prepare=None, columns=None, **read_options):
+    """
+    Read a CSV in chunks of `chunk_rows` rows and yield each as cleaned records
+    
+    Wrap in prefetch() so the next chunk is parsed while the current one is written.
+    
+    Args:
+        prepare: Optional DataFrame -> DataFrame step (e.g. filtering) per chunk
+        columns: If given, yield {column: [values]} for these columns instead of
+            one dict per row (no per-row dicts, smaller Bolt payload)
+        read_options: Extra pd.read_csv options (e.g. na_values)
+    """
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, **read_options):
+        chunk = clean_dataframe(chunk)
+        if prepare is not None:
+            chunk = prepare(chunk)
+        if columns is None:
+            yield chunk.to_dict('records')
+        else:
+            yield {column: chunk[column].tolist() for column in columns}
+
+def load_encounters_optimized(connection=None, batch_size=1000, server_side=SERVER_SIDE_LOAD):
     """
     OPTIMIZED: Load encounters using UNWIND batching instead of row-by-row
     
@@ -15,34 +38,68 @@ def load_encounters_optimized(connection=None, batch_size=1000):
     print("Loading Encounters (OPTIMIZED with BATCH processing)")
     print("=" * 60)
     
-    close_connection = connection is None
-    if close_connection:
-        connection = Neo4jConnection()
+    if connection is None:
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/encounters.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} encounters")
-        print(f"Using batch size: {batch_size}")
-        
-        # Convert DataFrame to list of dicts for batching
-        records = df.to_dict('records')
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        
-        total = 0
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
+    ensure_constraints(connection)
+    
+    if server_side:
+        # Neo4j reads encounters.csv itself (strings: convert types in Cypher)
+        total = load_csv_server_side(connection, "encounters.csv", """
+            CREATE (e:Encounter {
+                encounter_id: row.Id,
+                start: datetime(row.START),
+                stop: datetime(row.STOP),
+                encounterClass: row.ENCOUNTERCLASS,
+                code: toInteger(row.CODE),
+                description: row.DESCRIPTION,
+                baseCost: toFloat(row.BASE_ENCOUNTER_COST),
+                totalCost: toFloat(row.TOTAL_CLAIM_COST),
+                payerCoverage: toFloat(row.PAYER_COVERAGE),
+                reasonCode: toFloat(row.REASONCODE),
+                reasonDescription: row.REASONDESCRIPTION
+            })
+            WITH e, row
+            MATCH (p:Patient {patient_id: row.PATIENT})
+            MATCH (org:Organization {organization_id: row.ORGANIZATION})
+            MATCH (prov:Provider {provider_id: row.PROVIDER})
+            CREATE (p)-[:HAD_ENCOUNTER]->(e)
+            CREATE (e)-[:AT_ORGANIZATION]->(org)
+            CREATE (e)-[:SEEN_BY]->(prov)
+        """, batch_size, on_error="CONTINUE")
+        print(f"✓ Loaded {total} encounters (server-side LOAD CSV)")
+        return total
+    
+    print(f"Using batch size: {batch_size}")
+    group_size = batch_size * TX_BATCHES
+    
+    # CSV parsing/cleaning runs in a background thread, one group ahead of the writes
+    # Dates are parsed there too, so the server stores native DateTimes without parsing.
+    # REASONCODE has gaps: read it as float in every chunk (as the server-side toFloat)
+    groups = prefetch(read_record_groups(f"{IMPORT_DIR}/encounters.csv", group_size,
+                                         prepare=lambda chunk: to_datetimes(chunk, ['START', 'STOP']),
+                                         dtype={'REASONCODE': 'float64'}),
+                      maxsize=4)
+    
+    total = 0
+    current_batch = 0
+    with connection.driver.session() as session:
+        for group in groups:
+            current_batch += (len(group) + batch_size - 1) // batch_size
+            
+            try:
+                # One round trip per group; the server commits it in inner
+                # transactions of batch_size rows (auto-commit session.run
+                # required). A failing inner transaction is skipped, not fatal;
+                # REPORT STATUS counts its rows so the skip is reported below.
+                result = session.run("""
+                    UNWIND $batch AS row
+                    CALL (row) {
                         // Create Encounter node
                         CREATE (e:Encounter {
                             encounter_id: row.Id,
-                            start: datetime(row.START),
-                            stop: CASE WHEN row.STOP IS NOT NULL THEN datetime(row.STOP) ELSE null END,
+                            start: row.START,
+                            stop: row.STOP,
                             encounterClass: row.ENCOUNTERCLASS,
                             code: row.CODE,
                             description: row.DESCRIPTION,
@@ -62,25 +119,22 @@ def load_encounters_optimized(connection=None, batch_size=1000):
                         CREATE (p)-[:HAD_ENCOUNTER]->(e)
                         CREATE (e)-[:AT_ORGANIZATION]->(org)
                         CREATE (e)-[:SEEN_BY]->(prov)
-                        
-                        RETURN count(e) as created
-                    """, batch=batch)
-                    
-                    batch_count = result.single()['created']
-                    total += batch_count
-                    
-                    current_batch = (batch_idx // batch_size) + 1
-                    print(f"  Batch {current_batch}/{total_batches}: Processed {total} encounters...")
-                    
-                except Exception as e:
-                    print(f"Error in batch {current_batch}: {e}")
-                    # Continue with next batch instead of failing completely
-        
-        print(f"✓ Loaded {total} encounters")
-        return total
-    finally:
-        if close_connection:
-            connection.close()
+                    } IN TRANSACTIONS OF $rows ROWS ON ERROR CONTINUE
+                """ + REPORT_FAILED_ROWS, batch=group, rows=batch_size)
+                record = result.single()
+                if record["failed"]:
+                    print(f"Error in batches up to {current_batch}: {record['failed']} rows skipped: {record['errors']}")
+                # Skipped inner transactions created nothing: count what was committed
+                total += result.consume().counters.nodes_created
+                
+                print(f"  Batch {current_batch}: Processed {total} encounters...")
+                
+            except Exception as e:
+                print(f"Error in batches up to {current_batch}: {e}")
+                # Continue with next group instead of failing completely
+    
+    print(f"✓ Loaded {total} encounters")
+    return total
 
 
 def load_conditions_optimized(connection=None, batch_size=5000):
@@ -93,69 +147,62 @@ def load_conditions_optimized(connection=None, batch_size=5000):
     print("Loading Conditions (OPTIMIZED)")
     print("=" * 60)
     
-    close_connection = connection is None
-    if close_connection:
-        connection = Neo4jConnection()
+    if connection is None:
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/conditions.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} condition records")
-        
-        # Step 1: Create unique condition nodes (batched MERGE)
-        unique = df[['CODE', 'DESCRIPTION']].drop_duplicates()
-        print(f"Creating {len(unique)} unique condition nodes...")
-        
-        unique_records = unique.to_dict('records')
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(unique_records), batch_size):
-                batch = unique_records[batch_idx:batch_idx + batch_size]
-                
-                session.run("""
-                    UNWIND $batch AS row
-                    MERGE (c:Condition {code: row.CODE})
-                    SET c.description = row.DESCRIPTION
-                """, batch=batch)
-                
-                print(f"  Created {min(batch_idx + batch_size, len(unique_records))}/{len(unique_records)} conditions...")
+    ensure_constraints(connection)
+    df = pd.read_csv(f"{IMPORT_DIR}/conditions.csv")
+    df = clean_dataframe(df)
+    df = to_datetimes(df, ['START', 'STOP'])
+    print(f"Found {len(df)} condition records")
+    
+    # Step 1: Create unique condition nodes (batched MERGE)
+    # One row per code, with the description the SETs over all distinct pairs end with
+    pairs = df[['CODE', 'DESCRIPTION']].drop_duplicates()
+    unique = pairs.drop_duplicates(subset='CODE', keep='last')
+    print(f"Creating {len(unique)} unique condition nodes...")
+    
+    unique_records = unique.to_dict('records')
+    group_size = batch_size * TX_BATCHES
+    
+    # One session for both steps; each group of batches commits once
+    with connection.driver.session() as session:
+        for group_idx in range(0, len(unique_records), group_size):
+            group = unique_records[group_idx:group_idx + group_size]
+            
+            session.execute_write(write_batch_group, """
+                UNWIND $batch AS row
+                MERGE (c:Condition {code: row.CODE})
+                SET c.description = row.DESCRIPTION
+            """, group, batch_size)
+            
+            print(f"  Created {min(group_idx + group_size, len(unique_records))}/{len(unique_records)} conditions...")
         
         # Step 2: Create HAS_CONDITION relationships (batched)
         print(f"Creating relationships for {len(df)} condition records...")
-        records = df.to_dict('records')
-        
         total = 0
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
+        for group in iter_record_batches(df, group_size):
+            total += session.execute_write(write_batch_group, """
+                UNWIND $batch AS row
+                MATCH (p:Patient {patient_id: row.PATIENT})
+                MATCH (c:Condition {code: row.CODE})
+                MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
                 
-                result = session.run("""
-                    UNWIND $batch AS row
-                    MATCH (p:Patient {patient_id: row.PATIENT})
-                    MATCH (c:Condition {code: row.CODE})
-                    MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                    
-                    CREATE (p)-[:HAS_CONDITION {
-                        start: datetime(row.START),
-                        stop: CASE WHEN row.STOP IS NOT NULL THEN datetime(row.STOP) ELSE null END
-                    }]->(c)
-                    
-                    CREATE (e)-[:DIAGNOSED]->(c)
-                    
-                    RETURN count(c) as created
-                """, batch=batch)
+                CREATE (p)-[:HAS_CONDITION {
+                    start: row.START,
+                    stop: row.STOP
+                }]->(c)
                 
-                batch_count = result.single()['created']
-                total += batch_count
-                print(f"  Processed {total}/{len(records)} relationships...")
-        
-        print(f"✓ Loaded {len(unique)} unique conditions with {total} relationships")
-        return len(unique)
-    finally:
-        if close_connection:
-            connection.close()
+                CREATE (e)-[:DIAGNOSED]->(c)
+            """, group, batch_size)
+            
+            print(f"  Processed {total}/{len(df)} relationships...")
+    
+    print(f"✓ Loaded {len(pairs)} unique conditions with {total} relationships")
+    return len(pairs)
 
 
-def load_observations_optimized(connection=None, batch_size=5000):
+def load_observations_optimized(connection=None, batch_size=5000, server_side=SERVER_SIDE_LOAD):
     """
     OPTIMIZED: Load observations using batching
     
@@ -165,71 +212,90 @@ def load_observations_optimized(connection=None, batch_size=5000):
     print("Loading Observations (OPTIMIZED)")
     print("=" * 60)
     
-    close_connection = connection is None
-    if close_connection:
-        connection = Neo4jConnection()
+    if connection is None:
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/observations.csv")
-        df = clean_dataframe(df)
-        original_count = len(df)
-        
-        # Filter observations with invalid/empty dates (prevents datetime(NaN) errors)
-        df = df[df['DATE'].notna() & (df['DATE'] != '')]
-        filtered_count = original_count - len(df)
-        
-        if filtered_count > 0:
-            print(f"Found {len(df)} valid observations (filtered {filtered_count} with invalid dates)")
-        else:
-            print(f"Found {len(df)} observations")
-        print(f"Using batch size: {batch_size}")
+    ensure_constraints(connection)
+    
+    if server_side:
+        # Neo4j reads observations.csv itself; rows without a date are skipped
+        total = load_csv_server_side(connection, "observations.csv", """
+            WITH row WHERE row.DATE IS NOT NULL
+            CREATE (obs:Observation {
+                date: datetime(row.DATE),
+                code: row.CODE,
+                description: row.DESCRIPTION,
+                value: row.VALUE,
+                units: row.UNITS,
+                type: row.TYPE
+            })
+            WITH obs, row
+            MATCH (p:Patient {patient_id: row.PATIENT})
+            MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+            CREATE (p)-[:HAD_OBSERVATION]->(obs)
+            CREATE (e)-[:RECORDED]->(obs)
+        """, batch_size)
+        print(f"✓ Loaded {total} observations (server-side LOAD CSV)")
+        return total
+    
+    print(f"Using batch size: {batch_size}")
+    rows_per_group = batch_size * TX_BATCHES
+    
+    filtered_count = 0
+    
+    def valid_dates(chunk):
+        # Filter observations with invalid/empty dates (prevents datetime(NaN) errors);
+        # blank DATEs are already NA from read_csv, so one dropna covers both
+        nonlocal filtered_count
+        read_count = len(chunk)
+        chunk.dropna(subset=['DATE'], inplace=True)
+        filtered_count += read_count - len(chunk)
+        return to_datetimes(chunk, ['DATE'])
+    
+    # Stream the CSV one transaction group at a time: peak memory is a few
+    # chunks instead of the whole file twice, and parsing the next chunk
+    # (background thread) overlaps with writing the current one
+    groups = prefetch(read_record_groups(f"{IMPORT_DIR}/observations.csv", rows_per_group,
+                                         prepare=valid_dates, na_values=[' '],
+                                         columns=['DATE', 'CODE', 'DESCRIPTION', 'VALUE', 'UNITS',
+                                                  'TYPE', 'PATIENT', 'ENCOUNTER']), maxsize=4)
+    
+    query = """
+        WITH $batch AS col
+        UNWIND range(0, size(col.DATE) - 1) AS i
         
-        records = df.to_dict('records')
-        total_batches = (len(records) + batch_size - 1) // batch_size
+        CREATE (obs:Observation {
+            date: col.DATE[i],
+            code: col.CODE[i],
+            description: col.DESCRIPTION[i],
+            value: col.VALUE[i],
+            units: col.UNITS[i],
+            type: col.TYPE[i]
+        })
         
-        total = 0
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        CREATE (obs:Observation {
-                            date: datetime(row.DATE),
-                            code: row.CODE,
-                            description: row.DESCRIPTION,
-                            value: row.VALUE,
-                            units: row.UNITS,
-                            type: row.TYPE
-                        })
-                        
-                        WITH obs, row
-                        MATCH (p:Patient {patient_id: row.PATIENT})
-                        MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                        
-                        CREATE (p)-[:HAD_OBSERVATION]->(obs)
-                        CREATE (e)-[:RECORDED]->(obs)
-                        
-                        RETURN count(obs) as created
-                    """, batch=batch)
-                    
-                    current_batch = (batch_idx // batch_size) + 1
-                    
-                    batch_count = result.single()['created']
-                    total += batch_count
-                    
-                    if current_batch % 10 == 0 or current_batch == total_batches:
-                        print(f"  Batch {current_batch}/{total_batches}: Processed {total} observations...")
-                    
-                except Exception as e:
-                    batch_num = (batch_idx // batch_size) + 1
-                    print(f"Error in batch {batch_num}: {e}")
-                    raise
+        WITH obs, col, i
+        MATCH (p:Patient {patient_id: col.PATIENT[i]})
+        MATCH (e:Encounter {encounter_id: col.ENCOUNTER[i]})
         
-        print(f"✓ Loaded {total} observations")
-        return total
-    finally:
-        if close_connection:
-            connection.close()
+        CREATE (p)-[:HAD_OBSERVATION]->(obs)
+        CREATE (e)-[:RECORDED]->(obs)
+    """
+    
+    # Groups commit concurrently on separate pooled sessions
+    total = 0
+    committed = 0
+    try:
+        for created in write_groups_parallel(connection.driver, query,
+                                             (group for group in groups if row_count(group)),
+                                             batch_size):
+            total += created
+            committed += 1
+            print(f"  Group {committed}: Processed {total} observations...")
+    except Exception as e:
+        print(f"Error after {committed} groups: {e}")
+        raise
+    
+    if filtered_count > 0:
+        print(f"Filtered {filtered_count} observations with invalid dates")
+    print(f"✓ Loaded {total} observations")
+    return total
@@ -3,11 +3,51 @@ DrugBank CSV Loader - Fast drug data loading from vocabulary CSV
 Uses pandas for simple and fast CSV parsing
 """
 
+import heapq
+import numpy as np
 import pandas as pd
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
+
+
+# Compiled once: brand names in brackets, name before dosage/slash
+_BRACKETS_RE = re.compile(r'\[.*?\]')
+_NAME_RE = re.compile(r'^([A-Za-z\s\-]+?)(?:\s+\d+|\s+/)')
+
+# Stemming suffixes (none is a suffix of another, so at most one matches)
+_STEM_SUFFIXES = ('ing', 'ed', 'ine', 'ate', 'ol', 'il')
+_LONG_STEM_SUFFIXES = ('ing', 'ine', 'ate')
+
+
+def _stem(word: str) -> str:
+    """Simple stemming (remove common suffixes, keeping at least 4 characters)"""
+    # str.endswith with a tuple checks all suffixes in one C call
+    if word.endswith(_STEM_SUFFIXES):
+        cut = 3 if word.endswith(_LONG_STEM_SUFFIXES) else 2
+        if len(word) - cut >= 4:
+            return word[:-cut]
+    return word
+
+
+@lru_cache(maxsize=None)
+def _extract_drug_name(description: str) -> str:
+    """Cached body of extract_drug_name_from_synthea() (descriptions repeat across patients)"""
+    # Remove brand names in brackets [Tylenol]
+    description = _BRACKETS_RE.sub('', description)
+    
+    # Extract first word/phrase before dosage (numbers) or slash
+    match = _NAME_RE.match(description)
+    if match:
+        name = match.group(1).strip()
+    else:
+        # Fallback: first word
+        name = description.split()[0] if description.split() else description
+    
+    return name.lower().strip()
 
 
 class DrugBankCSVLoader:
@@ -21,6 +61,7 @@ class DrugBankCSVLoader:
     def __init__(self, csv_path: str):
         self.csv_path = Path(csv_path)
         self.drugs_df = None
+        self._search_cache = {}
     
     def load_csv(self) -> pd.DataFrame:
         """Load vocabulary CSV into pandas DataFrame"""
@@ -29,14 +70,107 @@ class DrugBankCSVLoader:
         # CSV columns: DrugBank ID, Accession Numbers, Common name, CAS, UNII, Synonyms, Standard InChI Key
         self.drugs_df = pd.read_csv(
             self.csv_path,
+            engine='pyarrow',  # Multithreaded C++ parser
             dtype=str,  # All as string to avoid type issues
             na_values=['', 'N/A', 'NULL'],
             keep_default_na=False  # Don't interpret 'NA' as NaN
         )
         
+        self._build_search_index()
+        
         print(f"✅ Loaded {len(self.drugs_df)} drugs")
         return self.drugs_df
     
+    def _build_search_index(self):
+        """Precompute lowercased names, stems and flattened synonyms for searching"""
+        # (method, query, threshold) -> matches; descriptions repeat across patients
+        self._search_cache = {}
+        
+        # Column arrays (structure of arrays) instead of per-row Series objects
+        self._search_ids = self.drugs_df['DrugBank ID'].to_numpy(dtype=object)
+        self._search_names = self.drugs_df['Common name'].map(str).str.lower().to_numpy(dtype=object)
+        self._search_stems = np.array([_stem(n) for n in self._search_names], dtype=object)
+        
+        # First row wins for duplicate ids/names/synonyms (same as the row scan order)
+        self._id_index = {}
+        for i, drugbank_id in enumerate(self._search_ids):
+            self._id_index.setdefault(drugbank_id, i)
+        
+        self._search_name_index = {}
+        for i, name in enumerate(self._search_names):
+            self._search_name_index.setdefault(name, i)
+        
+        # Synonyms exploded once into a flat column; the index is the owning row
+        synonyms = pd.Series(self.drugs_df['Synonyms'].map(str).str.lower().to_numpy(), dtype=object)
+        flat = synonyms.str.split('|').explode().str.strip()
+        flat = flat[flat != '']
+        self._search_synonyms = flat.to_numpy(dtype=object)
+        self._search_synonym_owner = flat.index.to_numpy(dtype=np.int64)
+        
+        # String lengths bound the reachable scores (see _hits)
+        self._search_name_lens = np.fromiter(map(len, self._search_names), dtype=np.int64,
+                                             count=len(self._search_names))
+        self._search_synonym_lens = np.fromiter(map(len, self._search_synonyms), dtype=np.int64,
+                                                count=len(self._search_synonyms))
+        
+        by_row = flat.groupby(level=0, sort=False).agg(list)
+        self._search_synonym_lists = [by_row.get(i, []) for i in range(len(synonyms))]
+        
+        owners = pd.DataFrame({'row': self._search_synonym_owner, 'synonym': self._search_synonyms})
+        owners = owners.drop_duplicates()
+        self._search_synonym_rows = owners.groupby('synonym', sort=False)['row'].agg(list).to_dict()
+    
+    @staticmethod
+    def _hits(name: str, strings: np.ndarray, lens: np.ndarray, threshold: float,
+              levenshtein: bool = False) -> np.ndarray:
+        """
+        Indices of `strings` scoring at least `threshold` against `name`
+        
+        Any edit script needs at least |len1 - len2| edits, so the Indel ratio is
+        at most 1 - |len1 - len2| / (len1 + len2) and the normalized Levenshtein
+        similarity at most 1 - |len1 - len2| / max(len1, len2). Strings whose
+        length alone rules out the threshold are not scored.
+        """
+        diff = np.abs(lens - len(name))
+        total = np.maximum(lens, len(name)) if levenshtein else lens + len(name)
+        rows = np.flatnonzero(diff <= (1 - threshold) * total + 1e-9)
+        if len(rows) == 0:
+            return rows
+        
+        if levenshtein:
+            scorer, cutoff = Levenshtein.normalized_similarity, threshold
+        else:
+            scorer, cutoff = fuzz.ratio, threshold * 100
+        # Copying out a subset only pays off when the length filter drops most strings
+        if len(rows) * 2 > len(strings):
+            scores = process.cdist([name], strings, scorer=scorer, score_cutoff=cutoff, workers=-1)[0]
+            return np.flatnonzero(scores > 0)
+        scores = process.cdist([name], strings[rows], scorer=scorer, score_cutoff=cutoff, workers=-1)[0]
+        return rows[scores > 0]
+    
+    def _candidate_rows(self, name: str, threshold: float, advanced: bool = False) -> Sequence[int]:
+        """
+        Rows that can match a query, in row order (a lossless prefilter)
+        
+        Uses the same RapidFuzz ratio as _fuzzy_match(), so every row whose name
+        or a synonym passes _fuzzy_match() also passes it here. Exact matches
+        score 1.0; advanced searches also keep stem and Levenshtein hits.
+        """
+        if threshold <= 0:
+            return range(len(self._search_names))
+        
+        candidates = np.zeros(len(self._search_names), dtype=bool)
+        candidates[self._hits(name, self._search_names, self._search_name_lens, threshold)] = True
+        synonyms = self._hits(name, self._search_synonyms, self._search_synonym_lens, threshold)
+        candidates[self._search_synonym_owner[synonyms]] = True
+        candidates[self._search_synonym_rows.get(name, [])] = True
+        
+        if advanced:
+            candidates |= self._search_stems == _stem(name)
+            candidates[self._hits(name, self._search_names, self._search_name_lens, 0.85,
+                                  levenshtein=True)] = True
+        return np.flatnonzero(candidates)
+    
     def get_drug_by_id(self, drugbank_id: str) -> Optional[Dict]:
         """
         Get drug data by DrugBank ID
@@ -50,13 +184,14 @@ class DrugBankCSVLoader:
         if self.drugs_df is None:
             raise RuntimeError("CSV not loaded. Call load_csv() first.")
         
-        row = self.drugs_df[self.drugs_df['DrugBank ID'] == drugbank_id]
-        if row.empty:
+        i = self._id_index.get(drugbank_id)
+        if i is None:
             return None
         
-        return row.iloc[0].to_dict()
+        return self.drugs_df.iloc[i].to_dict()
     
-    def search_by_name(self, name: str, threshold: float = 0.85) -> List[Tuple[str, float]]:
+    def search_by_name(self, name: str, threshold: float = 0.85,
+                       top_k: Optional[int] = None) -> List[Tuple[str, float]]:
         """
         Search drugs by name (fuzzy matching)
         
@@ -69,6 +204,7 @@ class DrugBankCSVLoader:
         Args:
             name: Drug name to search for
             threshold: Minimum similarity score (0.0-1.0)
+            top_k: Return only the best k drugs (None: all)
         
         Returns:
             List of (drugbank_id, confidence_score) tuples, sorted by confidence
@@ -77,21 +213,30 @@ class DrugBankCSVLoader:
             raise RuntimeError("CSV not loaded. Call load_csv() first.")
         
         name_lower = name.lower().strip()
+        # Nothing beats an exact name hit (1.0, earliest row) when only the best is wanted
+        if top_k == 1 and name_lower in self._search_name_index:
+            return [(self._search_ids[self._search_name_index[name_lower]], 1.0)]
+        
+        cache_key = ('standard', name_lower, threshold, top_k)
+        if cache_key in self._search_cache:
+            return list(self._search_cache[cache_key])
+        
         matches = []
+        synonym_rows = set(self._search_synonym_rows.get(name_lower, ()))
         
-        for _, row in self.drugs_df.iterrows():
-            drugbank_id = row['DrugBank ID']
-            common_name = str(row['Common name']).lower()
-            synonyms = str(row['Synonyms']).lower()
+        # Only rows that can reach the threshold are scored
+        for i in self._candidate_rows(name_lower, threshold):
+            drugbank_id = self._search_ids[i]
+            common_name = self._search_names[i]
+            synonym_list = self._search_synonym_lists[i]
             
             # Exact match in common name
             if name_lower == common_name:
                 matches.append((drugbank_id, 1.0))
                 continue
             
-            # Exact match in synonyms (check each synonym)
-            synonym_list = [s.strip() for s in synonyms.split('|') if s.strip()]
-            if name_lower in synonym_list:
+            # Exact match in synonyms (precomputed synonym -> rows index)
+            if i in synonym_rows:
                 matches.append((drugbank_id, 0.99))
                 continue
             
@@ -103,35 +248,47 @@ class DrugBankCSVLoader:
             
             # Fuzzy match in synonyms (check each synonym)
             for synonym in synonym_list:
-                if synonym:
-                    score = self._fuzzy_match(name_lower, synonym)
-                    if score >= threshold:
-                        matches.append((drugbank_id, score))
-                        break
-        
-        # Sort by confidence (highest first)
-        matches.sort(key=lambda x: x[1], reverse=True)
-        
-        # Remove duplicates (keep highest confidence)
-        seen = set()
-        unique_matches = []
-        for drugbank_id, confidence in matches:
-            if drugbank_id not in seen:
-                unique_matches.append((drugbank_id, confidence))
-                seen.add(drugbank_id)
-        
-        return unique_matches
+                score = self._fuzzy_match(name_lower, synonym)
+                if score >= threshold:
+                    matches.append((drugbank_id, score))
+                    break
+        
+        unique_matches = self._rank_matches(matches, top_k)
+        self._search_cache[cache_key] = unique_matches
+        return list(unique_matches)
+    
+    @staticmethod
+    def _rank_matches(matches: list, top_k: Optional[int]) -> list:
+        """
+        Best match per drug, highest confidence first (ties: earlier match first)
+        
+        Deduplicates in one pass, then selects the top k with a heap instead of
+        sorting every match. Entries are (drugbank_id, confidence, ...) tuples.
+        """
+        best = {}
+        for position, match in enumerate(matches):
+            current = best.get(match[0])
+            if current is None or match[1] > current[0][1]:
+                best[match[0]] = (match, position)
+        
+        key = lambda entry: (entry[0][1], -entry[1])
+        if top_k is None:
+            ranked = sorted(best.values(), key=key, reverse=True)
+        else:
+            ranked = heapq.nlargest(top_k, best.values(), key=key)
+        return [match for match, _ in ranked]
     
     def _fuzzy_match(self, str1: str, str2: str) -> float:
         """
-        Calculate string similarity using SequenceMatcher
+        Calculate string similarity (RapidFuzz's bit-parallel Indel ratio)
         
         Returns:
             Similarity score (0.0 - 1.0)
         """
-        return SequenceMatcher(None, str1, str2).ratio()
+        return fuzz.ratio(str1, str2) / 100.0
     
-    def search_by_name_advanced(self, name: str, threshold: float = 0.75) -> List[Tuple[str, float, str]]:
+    def search_by_name_advanced(self, name: str, threshold: float = 0.75,
+                                top_k: Optional[int] = None) -> List[Tuple[str, float, str]]:
         """
         Advanced search with multiple matching strategies (Option C)
         
@@ -145,6 +302,7 @@ class DrugBankCSVLoader:
         Args:
             name: Drug name to search for
             threshold: Minimum similarity score
+            top_k: Return only the best k drugs (None: all)
         
         Returns:
             List of (drugbank_id, confidence, method) tuples
@@ -153,41 +311,24 @@ class DrugBankCSVLoader:
             raise RuntimeError("CSV not loaded. Call load_csv() first.")
         
         name_lower = name.lower().strip()
-        matches = []
+        # Nothing beats an exact name hit (1.0, earliest row) when only the best is wanted
+        if top_k == 1 and name_lower in self._search_name_index:
+            return [(self._search_ids[self._search_name_index[name_lower]], 1.0, 'exact_match')]
         
-        # Helper: Simple stemming (remove common suffixes)
-        def stem(word: str) -> str:
-            suffixes = ['ing', 'ed', 'ine', 'ate', 'ol', 'il']
-            for suffix in suffixes:
-                if word.endswith(suffix) and len(word) > len(suffix) + 3:
-                    return word[:-len(suffix)]
-            return word
-        
-        # Helper: Levenshtein distance
-        def levenshtein_distance(s1: str, s2: str) -> int:
-            if len(s1) < len(s2):
-                return levenshtein_distance(s2, s1)
-            if len(s2) == 0:
-                return len(s1)
-            
-            previous_row = range(len(s2) + 1)
-            for i, c1 in enumerate(s1):
-                current_row = [i + 1]
-                for j, c2 in enumerate(s2):
-                    insertions = previous_row[j + 1] + 1
-                    deletions = current_row[j] + 1
-                    substitutions = previous_row[j] + (c1 != c2)
-                    current_row.append(min(insertions, deletions, substitutions))
-                previous_row = current_row
-            
-            return previous_row[-1]
+        cache_key = ('advanced', name_lower, threshold, top_k)
+        if cache_key in self._search_cache:
+            return list(self._search_cache[cache_key])
+        
+        matches = []
         
-        name_stem = stem(name_lower)
+        name_stem = _stem(name_lower)
+        synonym_rows = set(self._search_synonym_rows.get(name_lower, ()))
         
-        for _, row in self.drugs_df.iterrows():
-            drugbank_id = row['DrugBank ID']
-            common_name = str(row['Common name']).lower()
-            synonyms = str(row['Synonyms']).lower()
+        # Only rows that can reach one of the strategies below are scored
+        for i in self._candidate_rows(name_lower, threshold, advanced=True):
+            drugbank_id = self._search_ids[i]
+            common_name = self._search_names[i]
+            synonym_list = self._search_synonym_lists[i]
             
             # Strategy 1: Exact match
             if name_lower == common_name:
@@ -195,26 +336,22 @@ class DrugBankCSVLoader:
                 continue
             
             # Strategy 2: Exact synonym match
-            synonym_list = [s.strip() for s in synonyms.split('|') if s.strip()]
-            if name_lower in synonym_list:
+            if i in synonym_rows:
                 matches.append((drugbank_id, 0.99, 'synonym_exact'))
                 continue
             
             # Strategy 3: Stemming match
-            common_stem = stem(common_name)
+            common_stem = self._search_stems[i]
             if name_stem == common_stem and len(name_stem) > 3:
                 matches.append((drugbank_id, 0.95, 'stemming'))
                 continue
             
-            # Strategy 4: Levenshtein distance (for close typos)
-            max_len = max(len(name_lower), len(common_name))
-            if max_len > 0:
-                distance = levenshtein_distance(name_lower, common_name)
-                lev_score = 1.0 - (distance / max_len)
-                
-                if lev_score >= 0.85:  # Very close match
-                    matches.append((drugbank_id, lev_score, 'levenshtein'))
-                    continue
+            # Strategy 4: Levenshtein distance (for close typos); score_cutoff
+            # lets RapidFuzz stop early and return 0 below the cutoff
+            lev_score = Levenshtein.normalized_similarity(name_lower, common_name, score_cutoff=0.85)
+            if lev_score >= 0.85:  # Very close match
+                matches.append((drugbank_id, lev_score, 'levenshtein'))
+                continue
             
             # Strategy 5: Fuzzy match (existing logic)
             score = self._fuzzy_match(name_lower, common_name)
@@ -224,24 +361,130 @@ class DrugBankCSVLoader:
             
             # Also check synonyms with fuzzy match
             for synonym in synonym_list:
-                if synonym:
-                    score = self._fuzzy_match(name_lower, synonym)
-                    if score >= threshold:
-                        matches.append((drugbank_id, score, 'fuzzy_synonym'))
-                        break
-        
-        # Sort by confidence (highest first)
-        matches.sort(key=lambda x: x[1], reverse=True)
-        
-        # Remove duplicates (keep highest confidence)
-        seen = set()
-        unique_matches = []
-        for drugbank_id, confidence, method in matches:
-            if drugbank_id not in seen:
-                unique_matches.append((drugbank_id, confidence, method))
-                seen.add(drugbank_id)
-        
-        return unique_matches
+                score = self._fuzzy_match(name_lower, synonym)
+                if score >= threshold:
+                    matches.append((drugbank_id, score, 'fuzzy_synonym'))
+                    break
+        
+        unique_matches = self._rank_matches(matches, top_k)
+        self._search_cache[cache_key] = unique_matches
+        return list(unique_matches)
+    
+    def search_by_name_batch(self, names: List[str], threshold: float = 0.85,
+                             block_size: int = 64) -> List[Optional[Tuple[str, float]]]:
+        """
+        Best search_by_name() match for many names at once
+        
+        Args:
+            names: Drug names to search for
+            threshold: Minimum similarity score (0.0-1.0)
+            block_size: Number of names scored per matrix (bounds memory)
+        
+        Returns:
+            One (drugbank_id, confidence) tuple or None per input name
+        """
+        return [match[:2] if match else None
+                for match in self._search_batch(names, threshold, block_size, advanced=False)]
+    
+    def search_by_name_advanced_batch(self, names: List[str], threshold: float = 0.75,
+                                      block_size: int = 64) -> List[Optional[Tuple[str, float, str]]]:
+        """
+        Best search_by_name_advanced() match for many names at once
+        
+        Args:
+            names: Drug names to search for
+            threshold: Minimum similarity score
+            block_size: Number of names scored per matrix (bounds memory)
+        
+        Returns:
+            One (drugbank_id, confidence, method) tuple or None per input name
+        """
+        return self._search_batch(names, threshold, block_size, advanced=True)
+    
+    def _search_batch(self, names: List[str], threshold: float, block_size: int,
+                      advanced: bool) -> List[Optional[Tuple[str, float, str]]]:
+        """
+        Score many names against all drugs with the single-name strategy cascade
+        
+        Levenshtein and fuzzy scores of every (name, drug) pair are computed as
+        dense RapidFuzz matrices (process.cdist, all cores) instead of one Python
+        call per pair; the best drug per name is the first one with the highest
+        score, as in the single-name searches.
+        """
+        if self.drugs_df is None:
+            raise RuntimeError("CSV not loaded. Call load_csv() first.")
+        
+        queries = [name.lower().strip() for name in names]
+        results: List[Optional[Tuple[str, float, str]]] = [None] * len(queries)
+        pending = []
+        
+        # Exact name hits can't be beaten - resolve them with a dict lookup
+        for i, query in enumerate(queries):
+            if query in self._search_name_index:
+                results[i] = (self._search_ids[self._search_name_index[query]], 1.0, 'exact_match')
+            else:
+                pending.append(i)
+        
+        # Per-drug strategy cascade, in priority order
+        if advanced:
+            methods = ['synonym_exact', 'stemming', 'levenshtein', 'fuzzy_match', 'fuzzy_synonym']
+        else:
+            methods = ['synonym_exact', 'fuzzy_match', 'fuzzy_synonym']
+        n_drugs = len(self._search_names)
+        
+        for start in range(0, len(pending), block_size):
+            block = pending[start:start + block_size]
+            block_queries = [queries[i] for i in block]
+            
+            fuzzy = process.cdist(block_queries, self._search_names,
+                                  scorer=fuzz.ratio, dtype=np.float64, workers=-1) / 100.0
+            synonym_fuzzy = self._first_synonym_scores(block_queries, threshold)
+            if advanced:
+                lev = process.cdist(block_queries, self._search_names,
+                                    scorer=Levenshtein.normalized_similarity,
+                                    score_cutoff=0.85, dtype=np.float64, workers=-1)
+            
+            for row, i in enumerate(block):
+                synonym_hit = np.zeros(n_drugs, dtype=bool)
+                synonym_hit[self._search_synonym_rows.get(queries[i], [])] = True
+                conditions = [synonym_hit]
+                scores = [0.99]
+                
+                if advanced:
+                    query_stem = _stem(queries[i])
+                    stem_hit = (self._search_stems == query_stem) if len(query_stem) > 3 else np.zeros(n_drugs, dtype=bool)
+                    conditions += [stem_hit, lev[row] >= 0.85]
+                    scores += [0.95, lev[row]]
+                
+                conditions += [fuzzy[row] >= threshold, synonym_fuzzy[row] >= threshold]
+                scores += [fuzzy[row], synonym_fuzzy[row]]
+                
+                method = np.select(conditions, range(1, len(methods) + 1), default=0)
+                score = np.select(conditions, scores, default=0.0)
+                
+                best = int(np.argmax(score))
+                if method[best]:
+                    results[i] = (self._search_ids[best], float(score[best]), methods[method[best] - 1])
+        
+        return results
+    
+    def _first_synonym_scores(self, queries: List[str], threshold: float) -> np.ndarray:
+        """
+        Per (query, drug): fuzzy score of the drug's first synonym reaching the
+        threshold (0 if none), matching the synonym loop of the single-name searches
+        """
+        first_scores = np.zeros((len(queries), len(self._search_names)), dtype=np.float64)
+        if len(self._search_synonyms) == 0:
+            return first_scores
+        
+        synonym_scores = process.cdist(queries, self._search_synonyms,
+                                       scorer=fuzz.ratio, dtype=np.float64, workers=-1) / 100.0
+        for row in range(len(queries)):
+            hits = np.flatnonzero(synonym_scores[row] >= threshold)
+            # Synonyms are stored in row order, so the first hit per owner is its first synonym hit
+            owners, first = np.unique(self._search_synonym_owner[hits], return_index=True)
+            first_scores[row, owners] = synonym_scores[row, hits[first]]
+        return first_scores
     
     def extract_drug_name_from_synthea(self, description: str) -> str:
         """
@@ -261,18 +504,33 @@ class DrugBankCSVLoader:
         Returns:
             Extracted drug name (lowercase)
         """
-        # Remove brand names in brackets [Tylenol]
-        description = re.sub(r'\[.*?\]', '', description)
+        return _extract_drug_name(description)
+    
+    def extract_drug_names_from_synthea(self, descriptions: List[str]) -> List[str]:
+        """
+        Vectorized extract_drug_name_from_synthea() for many descriptions
         
-        # Extract first word/phrase before dosage (numbers) or slash
-        match = re.match(r'^([A-Za-z\s\-]+?)(?:\s+\d+|\s+/)', description)
-        if match:
-            name = match.group(1).strip()
-        else:
-            # Fallback: first word
-            name = description.split()[0] if description.split() else description
+        Runs the same regexes once over a pandas string column instead of
+        one Python call per description, and only once per unique description.
+        
+        Args:
+            descriptions: Synthea medication descriptions
+        
+        Returns:
+            Extracted drug names (lowercase), in input order
+        """
+        if not descriptions:
+            return []
+        
+        codes, uniques = pd.factorize(pd.Series(descriptions, dtype=object))
+        cleaned = pd.Series(uniques, dtype=object).str.replace(_BRACKETS_RE, '', regex=True)
+        names = cleaned.str.extract(_NAME_RE, expand=False).str.strip()
+        
+        # Fallback: first word (or the whole description if it has none)
+        first_words = cleaned.str.split().str[0]
+        names = names.fillna(first_words).fillna(cleaned)
         
-        return name.lower().strip()
+        return names.str.lower().str.strip().to_numpy(dtype=object)[codes].tolist()
     
     def get_all_drugs(self) -> pd.DataFrame:
         """
@@ -3,21 +3,161 @@ DrugBank Interaction Parser - Parse drug-drug interactions from XML
 Uses streaming to handle large 1.6 GB file efficiently
 """
 
-import xml.etree.ElementTree as ET
-from typing import Iterator, Tuple
+from collections import deque
+from io import BytesIO
+from itertools import chain
+from lxml import etree
+from multiprocessing import Pool
+from typing import BinaryIO, Iterator, List, Tuple, Union
+import mmap
+import os
+
+DRUGBANK_NS = 'http://www.drugbank.ca'
+
+# Top-level drugs start at column 0 with attributes; nested pathway <drug> elements don't
+TOP_LEVEL_DRUG = b'\n<drug '
+
+
+# Bytes handed to the parser per feed() call
+FEED_BYTES = 1024 * 1024
+
+
+class _InteractionTarget:
+    """
+    lxml parser target: collects interactions from start/end/data callbacks
+    
+    No Element objects are built; only the text of the primary drugbank-id and
+    of each interaction's drugbank-id/description children is buffered.
+    """
+    
+    def __init__(self):
+        self.drug_tag = f'{{{DRUGBANK_NS}}}drug'
+        self.id_tag = f'{{{DRUGBANK_NS}}}drugbank-id'
+        self.interaction_tag = f'{{{DRUGBANK_NS}}}drug-interaction'
+        self.description_tag = f'{{{DRUGBANK_NS}}}description'
+        self.interactions = []
+        self.depth = 0
+        self.current_drug_id = None
+        self.interaction_depth = None
+        self.target_id = None
+        self.description = None
+        self.capture = None  # (tag, depth) of the element whose text is buffered
+        self.text = []
+    
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.capture:
+            # Only the leading text counts (like Element.text)
+            self.capture = (None, self.capture[1])
+        elif tag == self.interaction_tag:
+            self.interaction_depth = self.depth
+            self.target_id = None
+            self.description = None
+        elif self.interaction_depth is not None and self.depth == self.interaction_depth + 1:
+            if (tag == self.id_tag and self.target_id is None) or \
+                    (tag == self.description_tag and self.description is None):
+                self.capture = (tag, self.depth)
+                self.text = []
+        elif tag == self.id_tag and attrib.get('primary') == 'true':
+            # Primary drugbank-id comes first in each drug, before its interactions
+            self.capture = (tag, self.depth)
+            self.text = []
+    
+    def data(self, data):
+        if self.capture and self.capture[0]:
+            self.text.append(data)
+    
+    def end(self, tag):
+        if self.capture and self.capture[1] == self.depth:
+            text = ''.join(self.text)
+            if self.capture[0] is None or self.capture[0] == tag:
+                if self.interaction_depth is not None:
+                    if tag == self.id_tag:
+                        self.target_id = text
+                    else:
+                        self.description = text
+                else:
+                    self.current_drug_id = text
+            self.capture = None
+        elif tag == self.interaction_tag and self.depth == self.interaction_depth:
+            if self.current_drug_id and self.target_id and self.description:
+                self.interactions.append((self.current_drug_id, self.target_id, self.description))
+            self.interaction_depth = None
+        elif tag == self.drug_tag and self.depth == 2:
+            # Top-level drug finished
+            self.current_drug_id = None
+        self.depth -= 1
+    
+    def close(self):
+        return None
+
+
+def _iter_interaction_lists(source: Union[str, BinaryIO]) -> Iterator[List[Tuple[str, str, str]]]:
+    """Stream lists of (source_id, target_id, description), one per fed chunk of the document"""
+    # Callback (SAX-style) parsing with libxml2: the document is fed in chunks
+    # and the interactions collected per chunk are yielded, so nothing but the
+    # current drug id and the pending tuples is ever held in memory
+    target = _InteractionTarget()
+    parser = etree.XMLParser(target=target, huge_tree=True)
+    
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        while chunk := f.read(FEED_BYTES):
+            parser.feed(chunk)
+            if target.interactions:
+                yield target.interactions
+                target.interactions = []
+        parser.close()
+        if target.interactions:
+            yield target.interactions
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _iter_interactions(source: Union[str, BinaryIO]) -> Iterator[Tuple[str, str, str]]:
+    """Stream (source_id, target_id, description) from a DrugBank XML document"""
+    for interactions in _iter_interaction_lists(source):
+        yield from interactions
+
+
+def _rebatch(lists: Iterator[list], size: int) -> Iterator[list]:
+    """Regroup a stream of lists into lists of exactly `size` items (the last may be shorter)"""
+    batch = []
+    for items in lists:
+        start = 0
+        while start < len(items):
+            take = min(size - len(batch), len(items) - start)
+            batch.extend(items[start:start + take])
+            start += take
+            if len(batch) == size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _parse_chunk(args: Tuple[str, bytes, int, int]) -> List[Tuple[str, str, str]]:
+    """Worker: parse the top-level drugs in one byte range, wrapped in the document root"""
+    xml_path, header, start, end = args
+    with open(xml_path, 'rb') as f:
+        f.seek(start)
+        body = f.read(end - start)
+    return list(_iter_interactions(BytesIO(header + body + b'</drugbank>')))
 
 
 class DrugBankInteractionParser:
     """
     Parse drug-drug interactions from DrugBank XML
-    Uses streaming (iterparse) to handle large file without memory overflow
+    Uses streaming (lxml parser target callbacks) to handle large file without memory overflow
     
     Performance: Parses 2.8M interactions in ~10-15 minutes
+    (parse_interactions_parallel() splits the work over all cores)
     """
     
     def __init__(self, xml_path: str):
         self.xml_path = xml_path
-        self.ns = {'db': 'http://www.drugbank.ca'}
+        self.ns = {'db': DRUGBANK_NS}
     
     def parse_interactions(self) -> Iterator[Tuple[str, str, str]]:
         """
@@ -33,49 +173,159 @@ class DrugBankInteractionParser:
         print("⏳ This will take 10-15 minutes (2.8M interactions)...")
         print("💡 Progress will be logged every 100,000 interactions")
         
+        return self._logged(_iter_interactions(self.xml_path))
+    
+    def parse_interactions_parallel(self, processes: int = None,
+                                    chunk_bytes: int = 64 * 1024 * 1024) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yield drug-drug interactions, parsing byte ranges of the XML in worker processes
+        
+        The file is split at top-level <drug> boundaries into ~chunk_bytes ranges;
+        each worker parses its range as a small standalone document. Results are
+        yielded in file order, so the output equals parse_interactions().
+        
+        Args:
+            processes: Number of worker processes (default: all cores)
+            chunk_bytes: Approximate size of one byte range
+        
+        Yields:
+            Tuple of (source_drugbank_id, target_drugbank_id, description)
+        """
+        print("🔗 Parsing drug-drug interactions from XML (parallel)...")
+        print("💡 Progress will be logged every 100,000 interactions")
+        
+        ranges = self._drug_ranges(chunk_bytes)
+        if ranges is None:
+            # No top-level drug boundaries found - parse sequentially
+            return self._logged(_iter_interactions(self.xml_path))
+        
+        header, bounds = ranges
+        tasks = [(self.xml_path, header, start, end) for start, end in bounds]
+        return self._logged(self._pooled(tasks, processes or os.cpu_count()))
+    
+    def parse_interactions_batched(self, chunk_size: int = 10000,
+                                   parallel: bool = False) -> Iterator[List[Tuple[str, str, str]]]:
+        """
+        Yield drug-drug interactions in lists of `chunk_size`
+        
+        The parser already collects interactions per fed chunk (or per worker
+        byte range), so those lists are regrouped instead of resuming a
+        generator once per interaction. Suited for UNWIND $batch writes.
+        
+        Args:
+            chunk_size: Interactions per yielded list (the last may be shorter)
+            parallel: Parse byte ranges in worker processes (as parse_interactions_parallel())
+        
+        Yields:
+            Lists of (source_drugbank_id, target_drugbank_id, description)
+        """
+        print("🔗 Parsing drug-drug interactions from XML (batched)...")
+        print("💡 Progress will be logged every 100,000 interactions")
+        
+        ranges = self._drug_ranges(64 * 1024 * 1024) if parallel else None
+        if ranges is None:
+            lists = _iter_interaction_lists(self.xml_path)
+        else:
+            header, bounds = ranges
+            tasks = [(self.xml_path, header, start, end) for start, end in bounds]
+            lists = self._pooled_lists(tasks, os.cpu_count())
+        return self._logged_batches(_rebatch(lists, chunk_size))
+    
+    def _drug_ranges(self, chunk_bytes: int):
+        """
+        Split the file into byte ranges of whole top-level drugs
+        
+        Returns:
+            (header, [(start, end), ...]) where header is everything before the
+            first drug (XML declaration and root start tag), or None
+        """
+        with open(self.xml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first = mm.find(TOP_LEVEL_DRUG)
+            last = mm.rfind(b'</drugbank>')
+            if first < 0 or last < 0:
+                return None
+            
+            header = mm[:first + 1]
+            bounds = []
+            start = first + 1
+            while start < last:
+                end = mm.find(TOP_LEVEL_DRUG, start + chunk_bytes)
+                end = last if end < 0 or end > last else end + 1
+                bounds.append((start, end))
+                start = end
+            return header, bounds
+    
+    @staticmethod
+    def _pooled(tasks: list, processes: int) -> Iterator[Tuple[str, str, str]]:
+        return chain.from_iterable(DrugBankInteractionParser._pooled_lists(tasks, processes))
+    
+    @staticmethod
+    def _pooled_lists(tasks: list, processes: int) -> Iterator[List[Tuple[str, str, str]]]:
+        # The pool is created (workers forked) now, in the calling thread; only the
+        # result iterator is lazy. Callers may consume it from a helper thread (e.g.
+        # prefetch), and forking there while the main thread holds driver locks can
+        # deadlock a child on an inherited lock.
+        pool = Pool(processes=processes)
+        
+        def results():
+            # Sliding window instead of imap (no backpressure): at most `processes` ranges
+            # are parsed ahead of the consumer, so results can't pile up while writes lag
+            try:
+                pending = deque()
+                for task in tasks:
+                    if len(pending) >= processes:
+                        yield pending.popleft().get()
+                    pending.append(pool.apply_async(_parse_chunk, (task,)))
+                while pending:
+                    yield pending.popleft().get()
+            finally:
+                pool.terminate()
+        
+        return results()
+    
+    def _logged(self, interactions: Iterator[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str]]:
+        """Pass interactions through with progress logging and error reporting"""
+        interaction_count = 0
         try:
-            # Use iterparse for streaming (memory efficient)
-            context = ET.iterparse(self.xml_path, events=('end',))
-            current_drug_id = None
-            interaction_count = 0
+            for interaction in interactions:
+                yield interaction
+                interaction_count += 1
+                
+                # Progress logging every 100k interactions
+                if interaction_count % 100000 == 0:
+                    print(f"   Parsed: {interaction_count:,} interactions...")
             
-            for event, elem in context:
-                # Track current drug by finding primary drugbank-id
-                if elem.tag == f'{{{self.ns["db"]}}}drug':
-                    # Find primary drugbank-id (has attribute primary="true")
-                    primary_id_elem = elem.find('.//db:drugbank-id[@primary="true"]', self.ns)
-                    if primary_id_elem is not None:
-                        current_drug_id = primary_id_elem.text
+            print(f"✅ Parsed {interaction_count:,} interactions total")
+            
+        except FileNotFoundError:
+            print(f"❌ Error: XML file not found: {self.xml_path}")
+            raise
+        except etree.XMLSyntaxError as e:
+            print(f"❌ Error parsing XML: {e}")
+            raise
+        except Exception as e:
+            print(f"❌ Unexpected error: {e}")
+            raise
+    
+    def _logged_batches(self, batches: Iterator[list]) -> Iterator[list]:
+        """Pass interaction lists through with progress logging (checked once per list)"""
+        interaction_count = 0
+        next_report = 100000
+        try:
+            for batch in batches:
+                yield batch
+                interaction_count += len(batch)
                 
-                # Extract drug-interaction elements
-                if elem.tag == f'{{{self.ns["db"]}}}drug-interaction':
-                    if current_drug_id:
-                        # Get target drug ID
-                        target_id_elem = elem.find('db:drugbank-id', self.ns)
-                        # Get interaction description
-                        description_elem = elem.find('db:description', self.ns)
-                        
-                        if target_id_elem is not None and description_elem is not None:
-                            target_id = target_id_elem.text
-                            description = description_elem.text
-                            
-                            if target_id and description:
-                                yield (current_drug_id, target_id, description)
-                                interaction_count += 1
-                                
-                                # Progress logging every 100k interactions
-                                if interaction_count % 100000 == 0:
-                                    print(f"   Parsed: {interaction_count:,} interactions...")
-                    
-                    # Clear element to free memory (critical for large file!)
-                    elem.clear()
+                if interaction_count >= next_report:
+                    print(f"   Parsed: {interaction_count:,} interactions...")
+                    next_report = (interaction_count // 100000 + 1) * 100000
             
             print(f"✅ Parsed {interaction_count:,} interactions total")
             
         except FileNotFoundError:
             print(f"❌ Error: XML file not found: {self.xml_path}")
             raise
-        except ET.ParseError as e:
+        except etree.XMLSyntaxError as e:
             print(f"❌ Error parsing XML: {e}")
             raise
         except Exception as e:
@@ -3,8 +3,87 @@ OPTIMIZED Extended data loaders (Immunizations, Allergies, Careplans)
 ⚠️ IMPORTANT: Maintains EXACT same data structure as original!
 """
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
-import pandas as pd
+from .base import (get_connection, IMPORT_DIR, TX_BATCHES, clean_dataframe, code_descriptions,
+                   iter_record_batches, read_csv_arrow, to_datetimes, write_batch_group,
+                   write_partitions_parallel)
+
+# Cypher is built once at import; every batch sends the same string (one cached plan).
+# Dates arrive as native DateTimes (to_datetimes), so they are stored without parsing
+IMMUNIZATION_QUERY = """
+    UNWIND $batch AS row
+    
+    CREATE (i:Immunization {
+        patient_id: row.PATIENT,
+        date: row.DATE,
+        code: row.CODE,
+        description: row.DESCRIPTION,
+        baseCost: row.BASE_COST
+    })
+    
+    WITH i, row
+    MATCH (p:Patient {patient_id: row.PATIENT})
+    MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+    
+    CREATE (p)-[:HAD_IMMUNIZATION]->(i)
+    CREATE (e)-[:ADMINISTERED]->(i)
+"""
+
+ALLERGY_NODE_QUERY = """
+    UNWIND $batch AS row
+    MERGE (a:Allergy {code: row.CODE})
+    SET a.description = row.DESCRIPTION
+"""
+
+ALLERGY_LINK_QUERY = """
+    UNWIND $batch AS row
+    
+    MATCH (p:Patient {patient_id: row.PATIENT})
+    MATCH (a:Allergy {code: row.CODE})
+    MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+    
+    CREATE (p)-[:HAS_ALLERGY {
+        start: row.START,
+        stop: row.STOP
+    }]->(a)
+    
+    CREATE (e)-[:DIAGNOSED_ALLERGY]->(a)
+"""
+
+CAREPLAN_NODE_QUERY = """
+    UNWIND $batch AS row
+    MERGE (c:Careplan {code: row.CODE})
+    SET c.description = row.DESCRIPTION
+"""
+
+CAREPLAN_LINK_QUERY = """
+    UNWIND $batch AS row
+    
+    MATCH (p:Patient {patient_id: row.PATIENT})
+    MATCH (c:Careplan {code: row.CODE})
+    MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+    
+    CREATE (p)-[:HAS_CAREPLAN {
+        start: row.START,
+        stop: row.STOP,
+        reasonCode: row.REASONCODE,
+        reasonDescription: row.REASONDESCRIPTION
+    }]->(c)
+    
+    CREATE (e)-[:INITIATED_CAREPLAN]->(c)
+"""
+
+def write_nodes_and_links(tx, node_query, nodes, link_query, links, batch_size):
+    """
+    Transaction function: MERGE reference nodes, then link them, in one commit
+    
+    For small tables (careplans) where a single transaction is cheaper than
+    one commit per step; a failing row rolls back the whole table.
+    
+    Returns:
+        Number of link rows written
+    """
+    write_batch_group(tx, node_query, nodes, batch_size)
+    return write_batch_group(tx, link_query, links, batch_size)
 
 def load_immunizations_optimized(connection=None, batch_size=2000):
     """
@@ -21,188 +100,99 @@ def load_immunizations_optimized(connection=None, batch_size=2000):
     print("Loading Immunizations (OPTIMIZED)")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/immunizations.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} immunization records")
-        
-        records = df.to_dict('records')
-        total = 0
-        
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        CREATE (i:Immunization {
-                            patient_id: row.PATIENT,
-                            date: datetime(row.DATE),
-                            code: row.CODE,
-                            description: row.DESCRIPTION,
-                            baseCost: row.BASE_COST
-                        })
-                        
-                        WITH i, row
-                        MATCH (p:Patient {patient_id: row.PATIENT})
-                        MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                        
-                        CREATE (p)-[:HAD_IMMUNIZATION]->(i)
-                        CREATE (e)-[:ADMINISTERED]->(i)
-                        
-                        RETURN count(i) as created
-                    """, batch=batch)
-                    
-                    batch_count = result.single()['created']
-                    total += batch_count
-                except Exception as e:
-                    print(f"Error in batch: {e}")
-        
-        print(f"✓ Loaded {total} immunizations")
-        return total
-        
-    finally:
-        if close_connection:
-            connection.close()
+    df = read_csv_arrow(f"{IMPORT_DIR}/immunizations.csv", string_columns=['DATE'])
+    df = to_datetimes(clean_dataframe(df), ['DATE'])
+    print(f"Found {len(df)} immunization records")
+    
+    total = 0
+    
+    # Partitions by patient commit concurrently (TX_BATCHES batches per transaction)
+    for written in write_partitions_parallel(connection.driver, IMMUNIZATION_QUERY, df, 'PATIENT', batch_size):
+        total += written
+    
+    print(f"✓ Loaded {total} immunizations")
+    return total
 
 def load_allergies(connection=None):
     """
-    Load allergy data - UNCHANGED (only 1.982 rows, already fast)
+    Load allergy data (1.982 rows) with UNWIND batching
     
-    ⚠️ Kept original implementation - no optimization needed
+    ⚠️ IDENTICAL OUTPUT to original - same Allergy nodes and
+    HAS_ALLERGY / DIAGNOSED_ALLERGY relationships
     """
     print("\n" + "=" * 60)
     print("Loading Allergies")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/allergies.csv")
-        df = clean_dataframe(df)
-        
-        # Convert empty STOP dates to pd.NA (prevents datetime("") errors)
-        df['STOP'] = df['STOP'].replace('', pd.NA)
-        
-        print(f"Found {len(df)} allergy records")
-        
-        # Create unique allergy nodes
-        unique = df[['CODE', 'DESCRIPTION']].drop_duplicates()
-        print(f"Creating {len(unique)} unique allergy nodes...")
-        
-        with connection.driver.session() as session:
-            for _, row in unique.iterrows():
-                session.run("MERGE (a:Allergy {code: $code}) SET a.description = $description",
-                           code=row['CODE'], description=row['DESCRIPTION'])
+    df = read_csv_arrow(f"{IMPORT_DIR}/allergies.csv", string_columns=['START', 'STOP'])
+    df = to_datetimes(clean_dataframe(df), ['START', 'STOP'])
+    
+    print(f"Found {len(df)} allergy records")
+    
+    # Create unique allergy nodes
+    unique = code_descriptions(df)
+    print(f"Creating {len(unique)} unique allergy nodes...")
+    
+    batch_size = 500
+    with connection.driver.session() as session:
+        session.execute_write(write_batch_group, ALLERGY_NODE_QUERY, unique.to_dict('records'), batch_size)
         
-        # Create relationships (OPTIMIZED with batching)
+        # Create relationships (OPTIMIZED with batching); each group commits on its own,
+        # so a bad row only costs its group
         print(f"Creating {len(df)} allergy relationships...")
-        records = df.to_dict('records')
-        batch_size = 500
         total = 0
-        
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        MATCH (p:Patient {patient_id: row.PATIENT})
-                        MATCH (a:Allergy {code: row.CODE})
-                        MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                        
-                        CREATE (p)-[:HAS_ALLERGY {
-                            start: datetime(row.START),
-                            stop: CASE WHEN row.STOP IS NOT NULL THEN datetime(row.STOP) ELSE null END
-                        }]->(a)
-                        
-                        CREATE (e)-[:DIAGNOSED_ALLERGY]->(a)
-                        
-                        RETURN count(p) as created
-                    """, batch=batch)
-                    
-                    count = result.single()['created']
-                    total += count
-                except Exception as e:
-                    print(f"Error in batch: {e}")
-        
-        print(f"✓ Loaded {total} allergy relationships")
-        return total
-        
-    finally:
-        if close_connection:
-            connection.close()
+        for group in iter_record_batches(df, batch_size * TX_BATCHES):
+            try:
+                total += session.execute_write(write_batch_group, ALLERGY_LINK_QUERY, group, batch_size)
+            except Exception as e:
+                print(f"Error in batch group: {e}")
+    
+    print(f"✓ Loaded {total} allergy relationships")
+    return total
 
 def load_careplans(connection=None):
     """
-    Load careplan data - UNCHANGED (only 7.736 rows, already fast)
+    Load careplan data (7.736 rows) with UNWIND batching
     
-    ⚠️ Kept original implementation - no optimization needed
+    ⚠️ IDENTICAL OUTPUT to original - same Careplan nodes and
+    HAS_CAREPLAN / INITIATED_CAREPLAN relationships
     """
     print("\n" + "=" * 60)
     print("Loading Careplans")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
     
-    try:
-        df = pd.read_csv(f"{IMPORT_DIR}/careplans.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} careplan records")
-        
-        # Create unique careplan nodes
-        unique = df[['CODE', 'DESCRIPTION']].drop_duplicates()
-        print(f"Creating {len(unique)} unique careplan nodes...")
-        
-        with connection.driver.session() as session:
-            for _, row in unique.iterrows():
-                session.run("MERGE (c:Careplan {code: $code}) SET c.description = $description",
-                           code=row['CODE'], description=row['DESCRIPTION'])
-        
-        # Create relationships
-        total = 0
-        with connection.driver.session() as session:
-            for _, row in df.iterrows():
-                try:
-                    session.run("""
-                        MATCH (p:Patient {patient_id: $pat_id})
-                        MATCH (c:Careplan {code: $code})
-                        MATCH (e:Encounter {encounter_id: $enc_id})
-                        CREATE (p)-[:HAS_CAREPLAN {
-                            start: datetime($start),
-                            stop: CASE WHEN $stop IS NOT NULL THEN datetime($stop) ELSE null END,
-                            reasonCode: $reasonCode,
-                            reasonDescription: $reasonDescription
-                        }]->(c)
-                        CREATE (e)-[:INITIATED_CAREPLAN]->(c)
-                    """, pat_id=row['PATIENT'], code=row['CODE'], enc_id=row['ENCOUNTER'],
-                    start=row['START'], stop=row.get('STOP'),
-                    reasonCode=row.get('REASONCODE'), reasonDescription=row.get('REASONDESCRIPTION'))
-                    total += 1
-                except Exception as e:
-                    print(f"Error: {e}")
-        
-        print(f"✓ Loaded {total} careplan relationships")
-        return total
-        
-    finally:
-        if close_connection:
-            connection.close()
+    df = read_csv_arrow(f"{IMPORT_DIR}/careplans.csv", string_columns=['START', 'STOP'])
+    df = to_datetimes(clean_dataframe(df), ['START', 'STOP'])
+    print(f"Found {len(df)} careplan records")
+    
+    # Create unique careplan nodes
+    unique = code_descriptions(df)
+    print(f"Creating {len(unique)} unique careplan nodes...")
+    
+    # Nodes and relationships (batched; optional columns are added if missing) in one transaction
+    rows = df.reindex(columns=['PATIENT', 'CODE', 'ENCOUNTER', 'START', 'STOP',
+                               'REASONCODE', 'REASONDESCRIPTION'])
+    batch_size = 500
+    with connection.driver.session() as session:
+        try:
+            total = session.execute_write(write_nodes_and_links,
+                                          CAREPLAN_NODE_QUERY, unique.to_dict('records'),
+                                          CAREPLAN_LINK_QUERY, rows.to_dict('records'), batch_size)
+        except Exception as e:
+            print(f"Error: careplan transaction rolled back, nothing was committed: {e}")
+            raise
+    
+    print(f"✓ Loaded {total} careplan relationships")
+    return total
 
 # Backwards compatibility aliases
 load_immunizations = load_immunizations_optimized
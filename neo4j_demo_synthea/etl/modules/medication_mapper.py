@@ -67,6 +67,7 @@ class MedicationMapper:
         self.session = session
         self.csv_loader = csv_loader
         self.manual_mappings = {}
+        self._common_names = {}  # drugbank_id -> common name (verbose output)
         
         if manual_mappings_file and os.path.exists(manual_mappings_file):
             self._load_manual_mappings(manual_mappings_file)
@@ -86,6 +87,15 @@ class MedicationMapper:
         
         print(f"   📋 Loaded {len(self.manual_mappings)} manual mappings")
     
+    def _common_name(self, drugbank_id: str) -> str:
+        """DrugBank common name for an ID (looked up once per ID; the ID itself if unknown)"""
+        name = self._common_names.get(drugbank_id)
+        if name is None:
+            drug_info = self.csv_loader.get_drug_by_id(drugbank_id)
+            name = str(drug_info['Common name']) if drug_info else drugbank_id
+            self._common_names[drugbank_id] = name
+        return name
+    
     def get_current_medications(self) -> List[Dict]:
         """
         Get all Medications currently connected to Patients
@@ -133,16 +143,22 @@ class MedicationMapper:
         Returns:
             Tuple of (drugbank_id, confidence, method) or None if no match
         """
+        # Extract drug name from description
+        extracted_name = self.csv_loader.extract_drug_name_from_synthea(med_description)
+        return self._map_extracted(med_code, extracted_name, confidence_threshold)
+    
+    def _map_extracted(self,
+                       med_code: str,
+                       extracted_name: str,
+                       confidence_threshold: float) -> Optional[Tuple[str, float, str]]:
+        """map_medication() for an already extracted drug name"""
         # Check manual override first
         if med_code in self.manual_mappings:
             manual = self.manual_mappings[med_code]
             return (manual.drugbank_id, manual.confidence, 'manual_override')
         
-        # Extract drug name from description
-        extracted_name = self.csv_loader.extract_drug_name_from_synthea(med_description)
-        
         # Search in DrugBank
-        matches = self.csv_loader.search_by_name(extracted_name, threshold=confidence_threshold)
+        matches = self.csv_loader.search_by_name(extracted_name, threshold=confidence_threshold, top_k=1)
         
         if matches:
             best_drugbank_id, confidence = matches[0]
@@ -150,6 +166,40 @@ class MedicationMapper:
         
         return None
     
+    def _map_medications(self,
+                         medications: List[Dict],
+                         confidence_threshold: float) -> Tuple[List[str], List[Optional[Tuple[str, float, str]]]]:
+        """
+        map_medication() for many medications at once
+        
+        Names without a manual override are searched together with
+        search_by_name_batch(), which scores them as RapidFuzz matrices on all
+        cores instead of one search_by_name() call per medication.
+        
+        Returns:
+            (extracted names, one map_medication() result per medication)
+        """
+        extracted_names = [self.csv_loader.extract_drug_name_from_synthea(med["description"])
+                           for med in medications]
+        results: List[Optional[Tuple[str, float, str]]] = [None] * len(medications)
+        
+        pending = []
+        for i, med in enumerate(medications):
+            if med["code"] in self.manual_mappings:
+                manual = self.manual_mappings[med["code"]]
+                results[i] = (manual.drugbank_id, manual.confidence, 'manual_override')
+            else:
+                pending.append(i)
+        
+        if pending:
+            matches = self.csv_loader.search_by_name_batch(
+                [extracted_names[i] for i in pending], threshold=confidence_threshold)
+            for i, match in zip(pending, matches):
+                if match:
+                    results[i] = (match[0], match[1], 'csv_lookup')
+        
+        return extracted_names, results
+    
     def create_mapping_relationship(self,
                                    med_code: str,
                                    drugbank_id: str,
@@ -180,10 +230,30 @@ class MedicationMapper:
              method=method,
              extracted_name=extracted_name)
     
+    def create_mapping_relationships(self, rows: List[Dict]):
+        """
+        Create many MAPPED_TO relationships in one query (UNWIND)
+        
+        Args:
+            rows: Dicts with the create_mapping_relationship() arguments as keys
+                (med_code, drugbank_id, confidence, method, extracted_name)
+        """
+        self.session.run("""
+            UNWIND $rows AS row
+            MATCH (m:Medication {code: row.med_code})
+            MATCH (d:DrugBankDrug {drugbank_id: row.drugbank_id})
+            MERGE (m)-[r:MAPPED_TO]->(d)
+            SET r.confidence = row.confidence,
+                r.method = row.method,
+                r.extracted_name = row.extracted_name,
+                r.created = datetime()
+        """, rows=rows).consume()
+    
     def map_all_medications(self, 
                            confidence_threshold: float = 0.75,
                            delete_old: bool = True,
-                           verbose: bool = True) -> MappingResult:
+                           verbose: bool = True,
+                           write_batch_size: int = 500) -> MappingResult:
         """
         Map all current medications to DrugBank
         
@@ -191,6 +261,7 @@ class MedicationMapper:
             confidence_threshold: Minimum confidence score (0.0-1.0)
             delete_old: Whether to delete old mappings first
             verbose: Print detailed progress
+            write_batch_size: MAPPED_TO relationships written per query
         
         Returns:
             MappingResult with statistics
@@ -214,29 +285,26 @@ class MedicationMapper:
         medium_conf = 0
         low_conf = 0
         unmapped = []
+        pending = []
         
-        # Map each medication
-        for med in medications:
-            result = self.map_medication(
-                med["code"], 
-                med["description"],
-                confidence_threshold
-            )
-            
+        # Match all medications first (one batched search), then write
+        extracted_names, results = self._map_medications(medications, confidence_threshold)
+        
+        for med, extracted_name, result in zip(medications, extracted_names, results):
             if result:
                 drugbank_id, confidence, method = result
                 
-                # Extract name for relationship
-                extracted_name = self.csv_loader.extract_drug_name_from_synthea(med["description"])
-                
-                # Create relationship
-                self.create_mapping_relationship(
-                    med["code"],
-                    drugbank_id,
-                    confidence,
-                    method,
-                    extracted_name
-                )
+                # Create relationship (written in batches)
+                pending.append({
+                    "med_code": med["code"],
+                    "drugbank_id": drugbank_id,
+                    "confidence": confidence,
+                    "method": method,
+                    "extracted_name": extracted_name
+                })
+                if len(pending) >= write_batch_size:
+                    self.create_mapping_relationships(pending)
+                    pending = []
                 
                 mapped_count += 1
                 
@@ -253,15 +321,16 @@ class MedicationMapper:
                 
                 # Verbose output
                 if verbose:
-                    drug_info = self.csv_loader.get_drug_by_id(drugbank_id)
                     synthea_short = med['description'][:45]
-                    drugbank_name = drug_info['Common name'][:20]
+                    drugbank_name = self._common_name(drugbank_id)[:20]
                     method_icon = "📋" if method == 'manual_override' else "🔍"
                     print(f"   {indicator} {method_icon} {synthea_short:<45} → {drugbank_name:<20} ({confidence:.2f})")
             else:
-                extracted_name = self.csv_loader.extract_drug_name_from_synthea(med["description"])
                 unmapped.append((med["description"], extracted_name))
         
+        if pending:
+            self.create_mapping_relationships(pending)
+        
         return MappingResult(
             total_medications=total,
             mapped=mapped_count,
@@ -6,10 +6,13 @@ OPTIMIZED Medication data loader with BATCH processing
 - Same properties: All preserved
 """
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
+from .base import (get_connection, IMPORT_DIR, SERVER_SIDE_LOAD, clean_dataframe,
+                   code_descriptions, load_csv_server_side, prefetch, to_datetimes,
+                   write_partitions_parallel)
 import pandas as pd
 
-def load_medications_optimized(connection=None, batch_size=2000):
+def load_medications_optimized(connection=None, batch_size=2000, server_side=SERVER_SIDE_LOAD,
+                               chunk_rows=100000):
     """
     OPTIMIZED: Load medication data using UNWIND batching
     
@@ -20,118 +23,119 @@ def load_medications_optimized(connection=None, batch_size=2000):
     - All properties preserved
     
     Performance: 114.671 rows in ~15 seconds (was ~2 hours)
+    
+    The CSV is streamed in chunks of chunk_rows rows (the next one is parsed in
+    the background), so only about two chunks are in memory at a time.
+    
+    server_side: Neo4j reads medications.csv itself for the relationship steps
+    (LOAD CSV ... CALL IN TRANSACTIONS) instead of receiving Python batches
     """
     print("\n" + "=" * 60)
     print("Loading Medications (OPTIMIZED)")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
     
-    try:
-        # Read data
-        df = pd.read_csv(f"{IMPORT_DIR}/medications.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} medication records in CSV")
-        
-        # Step 1: Create unique medication nodes (batched MERGE)
-        unique_meds = df[['CODE', 'DESCRIPTION']].drop_duplicates()
-        print(f"Creating {len(unique_meds)} unique medication nodes...")
+    def prepare(chunk):
+        # Dates are parsed here, so the server stores native DateTimes without parsing
+        return chunk if server_side else to_datetimes(chunk, ['START', 'STOP'])
+    
+    # Stream data (server-side, only the unique nodes are built in Python).
+    # REASONCODE has gaps: read it as float in every chunk, as a whole-file read does
+    chunks = prefetch((prepare(clean_dataframe(chunk)) for chunk in pd.read_csv(
+        f"{IMPORT_DIR}/medications.csv", chunksize=chunk_rows,
+        usecols=['CODE', 'DESCRIPTION'] if server_side else None,
+        dtype=None if server_side else {'REASONCODE': 'float64'})), maxsize=1)
+    
+    records = 0
+    codes = set()
+    seen_pairs = set()
+    total_patient_meds = 0
+    total_prescriptions = 0
+    for df in chunks:
+        records += len(df)
+        print(f"Read {records} medication records from CSV...")
         
-        unique_records = unique_meds.to_dict('records')
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(unique_records), batch_size):
-                batch = unique_records[batch_idx:batch_idx + batch_size]
-                
-                session.run("""
-                    UNWIND $batch AS row
-                    MERGE (m:Medication {code: row.CODE})
-                    SET m.description = row.DESCRIPTION
-                """, batch=batch)
-                
-                if (batch_idx // batch_size + 1) % 10 == 0:
-                    print(f"  Created {min(batch_idx + batch_size, len(unique_records))}/{len(unique_records)} medication nodes...")
+        # Step 1: Create this chunk's medication nodes (batched MERGE)
+        # Only pairs new to this chunk: the descriptions end as in one whole-file pass
+        unique_meds = code_descriptions(df, seen_pairs)
+        codes.update(unique_meds['CODE'])
+        connection.write_batches("""
+            UNWIND $rows AS row
+            MERGE (m:Medication {code: row.CODE})
+            SET m.description = row.DESCRIPTION
+        """, unique_meds.to_dict('records'), batch_size)
         
-        print(f"✓ Created {len(unique_meds)} medication nodes")
+        if server_side:
+            continue
         
         # Step 2: Create TAKES_MEDICATION relationships (batched)
-        print(f"Creating {len(df)} TAKES_MEDICATION relationships...")
-        records = df.to_dict('records')
-        
-        total_patient_meds = 0
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        MATCH (p:Patient {patient_id: row.PATIENT})
-                        MATCH (m:Medication {code: row.CODE})
-                        
-                        MERGE (p)-[r:TAKES_MEDICATION]->(m)
-                        SET r.start = CASE WHEN row.START IS NOT NULL 
-                                      THEN datetime(row.START) ELSE null END,
-                            r.stop = CASE WHEN row.STOP IS NOT NULL 
-                                     THEN datetime(row.STOP) ELSE null END,
-                            r.baseCost = row.BASE_COST,
-                            r.payerCoverage = row.PAYER_COVERAGE,
-                            r.dispenses = row.DISPENSES,
-                            r.totalCost = row.TOTALCOST,
-                            r.reasonCode = row.REASONCODE,
-                            r.reasonDescription = row.REASONDESCRIPTION
-                        
-                        RETURN count(r) as created
-                    """, batch=batch)
-                    
-                    batch_count = result.single()['created']
-                    total_patient_meds += batch_count
-                    
-                    current_batch = (batch_idx // batch_size) + 1
-                    if current_batch % 10 == 0:
-                        print(f"  Processed {total_patient_meds}/{len(records)} patient-medication relationships...")
-                except Exception as e:
-                    print(f"Error in batch: {e}")
-        
-        print(f"✓ Loaded {total_patient_meds} patient-medication relationships")
+        # Partitioned by code: each Medication node (and so each (patient, code) pair)
+        # is written by one session, in file order
+        for written in write_partitions_parallel(connection.driver, """
+            UNWIND $batch AS row
+            
+            MATCH (p:Patient {patient_id: row.PATIENT})
+            MATCH (m:Medication {code: row.CODE})
+            
+            MERGE (p)-[r:TAKES_MEDICATION]->(m)
+            SET r.start = row.START,
+                r.stop = row.STOP,
+                r.baseCost = row.BASE_COST,
+                r.payerCoverage = row.PAYER_COVERAGE,
+                r.dispenses = row.DISPENSES,
+                r.totalCost = row.TOTALCOST,
+                r.reasonCode = row.REASONCODE,
+                r.reasonDescription = row.REASONDESCRIPTION
+        """, df, 'CODE', batch_size):
+            total_patient_meds += written
+            print(f"  Processed {total_patient_meds}/{records} patient-medication relationships...")
         
         # Step 3: Create PRESCRIBED relationships (batched)
-        print(f"Creating prescription relationships...")
-        records_with_encounter = [r for r in records if r.get('ENCOUNTER')]
-        print(f"Found {len(records_with_encounter)} prescriptions to link...")
-        
-        total_prescriptions = 0
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records_with_encounter), batch_size):
-                batch = records_with_encounter[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                        MATCH (m:Medication {code: row.CODE})
-                        
-                        MERGE (e)-[:PRESCRIBED]->(m)
-                        
-                        RETURN count(*) as created
-                    """, batch=batch)
-                    
-                    batch_count = result.single()['created']
-                    total_prescriptions += batch_count
-                except Exception as e:
-                    print(f"Error in prescription batch: {e}")
-        
-        print(f"✓ Loaded {total_prescriptions} prescription relationships")
+        prescriptions = df.loc[df['ENCOUNTER'].notna(), ['ENCOUNTER', 'CODE']]
+        for written in write_partitions_parallel(connection.driver, """
+            UNWIND $batch AS row
+            
+            MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+            MATCH (m:Medication {code: row.CODE})
+            
+            MERGE (e)-[:PRESCRIBED]->(m)
+        """, prescriptions, 'CODE', batch_size):
+            total_prescriptions += written
+    
+    print(f"✓ Created {len(codes)} medication nodes")
+    
+    if server_side:
+        # Steps 2 and 3 from the CSV in the Neo4j import dir (strings: convert types in Cypher)
+        total_patient_meds = load_csv_server_side(connection, "medications.csv", """
+            MATCH (p:Patient {patient_id: row.PATIENT})
+            MATCH (m:Medication {code: toInteger(row.CODE)})
+            MERGE (p)-[r:TAKES_MEDICATION]->(m)
+            SET r.start = datetime(row.START),
+                r.stop = datetime(row.STOP),
+                r.baseCost = toFloat(row.BASE_COST),
+                r.payerCoverage = toFloat(row.PAYER_COVERAGE),
+                r.dispenses = toInteger(row.DISPENSES),
+                r.totalCost = toFloat(row.TOTALCOST),
+                r.reasonCode = toFloat(row.REASONCODE),
+                r.reasonDescription = row.REASONDESCRIPTION
+        """, batch_size, on_error="CONTINUE", counter="relationships_created")
+        print(f"✓ Loaded {total_patient_meds} patient-medication relationships (server-side LOAD CSV)")
         
+        total_prescriptions = load_csv_server_side(connection, "medications.csv", """
+            WITH row WHERE row.ENCOUNTER IS NOT NULL
+            MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+            MATCH (m:Medication {code: toInteger(row.CODE)})
+            MERGE (e)-[:PRESCRIBED]->(m)
+        """, batch_size, on_error="CONTINUE", counter="relationships_created")
+        print(f"✓ Loaded {total_prescriptions} prescription relationships (server-side LOAD CSV)")
         return total_patient_meds
-        
-    finally:
-        if close_connection:
-            connection.close()
+    
+    print(f"✓ Loaded {total_patient_meds} patient-medication relationships")
+    print(f"✓ Loaded {total_prescriptions} prescription relationships")
+    
+    return total_patient_meds
 
 # Backwards compatibility alias
 load_medications = load_medications_optimized
@@ -3,108 +3,80 @@ Patient data loader
 Loads patient demographics from Synthea patients.csv
 """
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
+from .base import (get_connection, IMPORT_DIR, TX_BATCHES, clean_dataframe,
+                   iter_record_batches, row_count, write_batch_group)
 import pandas as pd
 
-def load_patients(connection=None):
-    """Load patient demographic data"""
+# CSV columns sent per patient; optional columns missing from the CSV become null
+PATIENT_COLUMNS = ['Id', 'BIRTHDATE', 'DEATHDATE', 'SSN', 'DRIVERS', 'PASSPORT', 'PREFIX',
+                   'FIRST', 'LAST', 'SUFFIX', 'MAIDEN', 'MARITAL', 'RACE', 'ETHNICITY', 'GENDER',
+                   'BIRTHPLACE', 'ADDRESS', 'CITY', 'STATE', 'COUNTY', 'FIPS', 'ZIP', 'LAT', 'LON',
+                   'INCOME', 'HEALTHCARE_EXPENSES', 'HEALTHCARE_COVERAGE', 'QALY', 'DALY']
+
+PATIENT_QUERY = """
+    UNWIND $batch AS row
+    CREATE (p:Patient {
+        patient_id: row.Id,
+        birthDate: date(row.BIRTHDATE),
+        deathDate: date(row.DEATHDATE),
+        ssn: row.SSN,
+        drivers: row.DRIVERS,
+        passport: row.PASSPORT,
+        prefix: row.PREFIX,
+        given: row.FIRST,
+        family: row.LAST,
+        suffix: row.SUFFIX,
+        maiden: row.MAIDEN,
+        maritalStatus: row.MARITAL,
+        race: row.RACE,
+        ethnicity: row.ETHNICITY,
+        gender: row.GENDER,
+        birthPlace: row.BIRTHPLACE,
+        address: row.ADDRESS,
+        city: row.CITY,
+        state: row.STATE,
+        county: row.COUNTY,
+        fips: row.FIPS,
+        zip: row.ZIP,
+        lat: row.LAT,
+        lon: row.LON,
+        income: row.INCOME,
+        healthcareExpenses: row.HEALTHCARE_EXPENSES,
+        healthcareCoverage: row.HEALTHCARE_COVERAGE,
+        qaly: row.QALY,
+        daly: row.DALY
+    })
+"""
+
+def load_patients(connection=None, batch_size=2000):
+    """Load patient demographic data (UNWIND batches, TX_BATCHES batches per transaction)"""
     print("\n" + "=" * 60)
     print("Loading Patients")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
+    
+    # Read data
+    df = pd.read_csv(f"{IMPORT_DIR}/patients.csv")
+    df = clean_dataframe(df.reindex(columns=PATIENT_COLUMNS))
+    print(f"Found {len(df)} patients in CSV")
+    
+    # Load patients
+    total = 0
+    errors = 0
+    
+    with connection.driver.session() as session:
+        for group in iter_record_batches(df, batch_size * TX_BATCHES):
+            try:
+                total += session.execute_write(write_batch_group, PATIENT_QUERY, group, batch_size)
+            except Exception as e:
+                # A failed transaction rolls back its whole group
+                errors += row_count(group)
+                print(f"Error loading patients: {e}")
     
-    try:
-        # Read data
-        df = pd.read_csv(f"{IMPORT_DIR}/patients.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} patients in CSV")
-        
-        # Load patients
-        total = 0
-        errors = 0
-        
-        with connection.driver.session() as session:
-            for _, row in df.iterrows():
-                try:
-                    session.run("""
-                        CREATE (p:Patient {
-                            patient_id: $id,
-                            birthDate: date($birthDate),
-                            deathDate: CASE WHEN $deathDate IS NOT NULL THEN date($deathDate) ELSE null END,
-                            ssn: $ssn,
-                            drivers: $drivers,
-                            passport: $passport,
-                            prefix: $prefix,
-                            given: $first,
-                            family: $last,
-                            suffix: $suffix,
-                            maiden: $maiden,
-                            maritalStatus: $marital,
-                            race: $race,
-                            ethnicity: $ethnicity,
-                            gender: $gender,
-                            birthPlace: $birthPlace,
-                            address: $address,
-                            city: $city,
-                            state: $state,
-                            county: $county,
-                            fips: $fips,
-                            zip: $zip,
-                            lat: $lat,
-                            lon: $lon,
-                            income: $income,
-                            healthcareExpenses: $expenses,
-                            healthcareCoverage: $coverage,
-                            qaly: $qaly,
-                            daly: $daly
-                        })
-                    """, 
-                    id=row['Id'], 
-                    birthDate=row['BIRTHDATE'], 
-                    deathDate=row.get('DEATHDATE'),
-                    ssn=row.get('SSN'),
-                    drivers=row.get('DRIVERS'),
-                    passport=row.get('PASSPORT'),
-                    prefix=row.get('PREFIX'),
-                    first=row.get('FIRST'), 
-                    last=row.get('LAST'),
-                    suffix=row.get('SUFFIX'),
-                    maiden=row.get('MAIDEN'),
-                    marital=row.get('MARITAL'),
-                    race=row.get('RACE'), 
-                    ethnicity=row.get('ETHNICITY'),
-                    gender=row.get('GENDER'),
-                    birthPlace=row.get('BIRTHPLACE'),
-                    address=row.get('ADDRESS'),
-                    city=row.get('CITY'),
-                    state=row.get('STATE'),
-                    county=row.get('COUNTY'),
-                    fips=row.get('FIPS'),
-                    zip=row.get('ZIP'),
-                    lat=row.get('LAT'),
-                    lon=row.get('LON'),
-                    income=row.get('INCOME'),
-                    expenses=row.get('HEALTHCARE_EXPENSES'),
-                    coverage=row.get('HEALTHCARE_COVERAGE'),
-                    qaly=row.get('QALY'),
-                    daly=row.get('DALY')
-                    )
-                    total += 1
-                except Exception as e:
-                    errors += 1
-                    if errors <= 5:  # Only print first 5 errors
-                        print(f"Error loading patient: {e}")
-        
-        print(f"✓ Loaded {total} patients ({errors} errors)")
-        return total
-        
-    finally:
-        if close_connection:
-            connection.close()
+    print(f"✓ Loaded {total} patients ({errors} errors)")
+    return total
 
 if __name__ == "__main__":
     # Can be run standalone
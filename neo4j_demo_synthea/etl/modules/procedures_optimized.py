@@ -6,10 +6,13 @@ OPTIMIZED Procedure data loader with BATCH processing
 - Same properties: All preserved
 """
 
-from .base import Neo4jConnection, IMPORT_DIR, clean_dataframe
+from .base import (get_connection, IMPORT_DIR, SERVER_SIDE_LOAD, clean_dataframe,
+                   code_descriptions, load_csv_server_side, prefetch, to_datetimes,
+                   write_partitions_parallel)
 import pandas as pd
 
-def load_procedures_optimized(connection=None, batch_size=2000):
+def load_procedures_optimized(connection=None, batch_size=2000, server_side=SERVER_SIDE_LOAD,
+                              chunk_rows=100000):
     """
     OPTIMIZED: Load procedure data using UNWIND batching
     
@@ -19,86 +22,90 @@ def load_procedures_optimized(connection=None, batch_size=2000):
     - All properties preserved
     
     Performance: 376.185 rows in ~40 seconds (was ~3 hours)
+    
+    The CSV is streamed in chunks of chunk_rows rows (the next one is parsed in
+    the background), so only about two chunks are in memory at a time.
+    
+    server_side: Neo4j reads procedures.csv itself for the relationship step
+    (LOAD CSV ... CALL IN TRANSACTIONS) instead of receiving Python batches
     """
     print("\n" + "=" * 60)
     print("Loading Procedures (OPTIMIZED)")
     print("=" * 60)
     
-    close_connection = False
     if connection is None:
-        connection = Neo4jConnection()
-        close_connection = True
+        connection = get_connection()
     
-    try:
-        # Read data
-        df = pd.read_csv(f"{IMPORT_DIR}/procedures.csv")
-        df = clean_dataframe(df)
-        print(f"Found {len(df)} procedure records in CSV")
-        
-        # Step 1: Create unique procedure nodes (batched MERGE)
-        unique_procs = df[['CODE', 'DESCRIPTION']].drop_duplicates()
-        print(f"Creating {len(unique_procs)} unique procedure nodes...")
+    def prepare(chunk):
+        # Dates are parsed here, so the server stores native DateTimes without parsing
+        return chunk if server_side else to_datetimes(chunk, ['START', 'STOP'])
+    
+    # Stream data (server-side, only the unique nodes are built in Python).
+    # REASONCODE has gaps: read it as float in every chunk, as a whole-file read does
+    chunks = prefetch((prepare(clean_dataframe(chunk)) for chunk in pd.read_csv(
+        f"{IMPORT_DIR}/procedures.csv", chunksize=chunk_rows,
+        usecols=['CODE', 'DESCRIPTION'] if server_side else None,
+        dtype=None if server_side else {'REASONCODE': 'float64'})), maxsize=1)
+    
+    records = 0
+    codes = set()
+    seen_pairs = set()
+    total = 0
+    for df in chunks:
+        records += len(df)
+        print(f"Read {records} procedure records from CSV...")
         
-        unique_records = unique_procs.to_dict('records')
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(unique_records), batch_size):
-                batch = unique_records[batch_idx:batch_idx + batch_size]
-                
-                session.run("""
-                    UNWIND $batch AS row
-                    MERGE (p:Procedure {code: row.CODE})
-                    SET p.description = row.DESCRIPTION
-                """, batch=batch)
-                
-                if (batch_idx // batch_size + 1) % 10 == 0:
-                    print(f"  Created {min(batch_idx + batch_size, len(unique_records))}/{len(unique_records)} procedure nodes...")
+        # Step 1: Create this chunk's procedure nodes (batched MERGE)
+        # Only pairs new to this chunk: the descriptions end as in one whole-file pass
+        unique_procs = code_descriptions(df, seen_pairs)
+        codes.update(unique_procs['CODE'])
+        connection.write_batches("""
+            UNWIND $rows AS row
+            MERGE (p:Procedure {code: row.CODE})
+            SET p.description = row.DESCRIPTION
+        """, unique_procs.to_dict('records'), batch_size)
         
-        print(f"✓ Created {len(unique_procs)} procedure nodes")
+        if server_side:
+            continue
         
         # Step 2: Create PERFORMED relationships (batched)
-        print(f"Creating {len(df)} PERFORMED relationships...")
-        records = df.to_dict('records')
-        
-        total = 0
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        
-        with connection.driver.session() as session:
-            for batch_idx in range(0, len(records), batch_size):
-                batch = records[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    result = session.run("""
-                        UNWIND $batch AS row
-                        
-                        MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
-                        MATCH (p:Procedure {code: row.CODE})
-                        
-                        MERGE (e)-[r:PERFORMED]->(p)
-                        SET r.start = datetime(row.START),
-                            r.stop = CASE WHEN row.STOP IS NOT NULL 
-                                     THEN datetime(row.STOP) ELSE null END,
-                            r.baseCost = row.BASE_COST,
-                            r.reasonCode = row.REASONCODE,
-                            r.reasonDescription = row.REASONDESCRIPTION
-                        
-                        RETURN count(r) as created
-                    """, batch=batch)
-                    
-                    batch_count = result.single()['created']
-                    total += batch_count
-                    
-                    current_batch = (batch_idx // batch_size) + 1
-                    if current_batch % 20 == 0 or current_batch == total_batches:
-                        print(f"  Batch {current_batch}/{total_batches}: Processed {total}/{len(records)} procedures...")
-                except Exception as e:
-                    print(f"Error in batch: {e}")
-        
-        print(f"✓ Loaded {total} procedure relationships")
+        # Partitioned by code: each Procedure node (and so each (encounter, code) pair)
+        # is written by one session, in file order
+        for written in write_partitions_parallel(connection.driver, """
+            UNWIND $batch AS row
+            
+            MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+            MATCH (p:Procedure {code: row.CODE})
+            
+            MERGE (e)-[r:PERFORMED]->(p)
+            SET r.start = row.START,
+                r.stop = row.STOP,
+                r.baseCost = row.BASE_COST,
+                r.reasonCode = row.REASONCODE,
+                r.reasonDescription = row.REASONDESCRIPTION
+        """, df, 'CODE', batch_size):
+            total += written
+            print(f"  Processed {total}/{records} procedures...")
+    
+    print(f"✓ Created {len(codes)} procedure nodes")
+    
+    if server_side:
+        # Step 2 from the CSV in the Neo4j import dir (strings: convert types in Cypher)
+        total = load_csv_server_side(connection, "procedures.csv", """
+            MATCH (e:Encounter {encounter_id: row.ENCOUNTER})
+            MATCH (p:Procedure {code: toInteger(row.CODE)})
+            MERGE (e)-[r:PERFORMED]->(p)
+            SET r.start = datetime(row.START),
+                r.stop = datetime(row.STOP),
+                r.baseCost = toFloat(row.BASE_COST),
+                r.reasonCode = toFloat(row.REASONCODE),
+                r.reasonDescription = row.REASONDESCRIPTION
+        """, batch_size, on_error="CONTINUE", counter="relationships_created")
+        print(f"✓ Loaded {total} procedure relationships (server-side LOAD CSV)")
         return total
-        
-    finally:
-        if close_connection:
-            connection.close()
+    
+    print(f"✓ Loaded {total} procedure relationships")
+    return total
 
 # Backwards compatibility alias
 load_procedures = load_procedures_optimized
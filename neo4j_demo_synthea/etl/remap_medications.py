@@ -128,30 +128,27 @@ def remap_medications():
             low_confidence = 0
             unmapped = []
             
-            for med in medications:
-                # Extract drug name
-                extracted_name = csv_loader.extract_drug_name_from_synthea(med["description"])
-                
-                # Search in DrugBank
-                matches = csv_loader.search_by_name(extracted_name, threshold=0.75)
+            # One vectorized extraction and one batched search over the unique names
+            # (candidate rows come from the search index, not a scan of every drug)
+            extracted_names = csv_loader.extract_drug_names_from_synthea(
+                [med["description"] for med in medications])
+            unique_names = list(dict.fromkeys(extracted_names))
+            best_matches = dict(zip(unique_names,
+                                    csv_loader.search_by_name_batch(unique_names, threshold=0.75)))
+            
+            mappings = []
+            for med, extracted_name in zip(medications, extracted_names):
+                match = best_matches[extracted_name]
                 
-                if matches:
+                if match:
                     # Take best match
-                    best_drugbank_id, confidence = matches[0]
-                    
-                    # Create MAPPED_TO relationship
-                    session.run("""
-                        MATCH (m:Medication {code: $med_code})
-                        MATCH (d:DrugBankDrug {drugbank_id: $drugbank_id})
-                        MERGE (m)-[r:MAPPED_TO]->(d)
-                        SET r.confidence = $confidence,
-                            r.method = 'csv_lookup',
-                            r.extracted_name = $extracted_name,
-                            r.created = datetime()
-                    """, med_code=med["code"], 
-                         drugbank_id=best_drugbank_id,
-                         confidence=confidence,
-                         extracted_name=extracted_name)
+                    best_drugbank_id, confidence = match
+                    mappings.append({
+                        "med_code": med["code"],
+                        "drugbank_id": best_drugbank_id,
+                        "confidence": confidence,
+                        "extracted_name": extracted_name,
+                    })
                     
                     mapped_count += 1
                     
@@ -175,6 +172,19 @@ def remap_medications():
                 else:
                     unmapped.append((med["description"], extracted_name))
             
+            # Create all MAPPED_TO relationships in one round trip
+            if mappings:
+                session.run("""
+                    UNWIND $mappings AS mapping
+                    MATCH (m:Medication {code: mapping.med_code})
+                    MATCH (d:DrugBankDrug {drugbank_id: mapping.drugbank_id})
+                    MERGE (m)-[r:MAPPED_TO]->(d)
+                    SET r.confidence = mapping.confidence,
+                        r.method = 'csv_lookup',
+                        r.extracted_name = mapping.extracted_name,
+                        r.created = datetime()
+                """, mappings=mappings).consume()
+            
             # Step 6: Summary
             print("\n" + "="*80)
             print("📊 Mapping Summary")